@@ -1,92 +1,127 @@
-from pyrogram import Client, filters
+from pyrogram import Client
 from pyrogram.types import Message
 from datetime import datetime
-import pandas as pd
 from io import BytesIO
+import os
+import time
+import asyncio
+import tempfile
+from background import run_blocking
+from transfer import EXPORT_KINDS, EXPORT_FORMATS, write_export, result_rows, LinkImport, remove_quietly
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+MAX_BATCH_RESULTS = 2000  # أقصى عدد أكواد في /results واحد
+BATCH_DOCUMENT_AFTER = 30  # أكتر من كده النتايج بتتبعت ملف
+
+
+def parse_student_ids(tokens) -> list:
+    # "101 102,103 200-250" ➤ قايمة أكواد بنفس الترتيب من غير تكرار
+    ids = []
+    for token in tokens:
+        for part in token.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            start, dash, end = part.partition('-')
+            if dash and start.isdigit() and end.isdigit() and int(start) <= int(end):
+                if len(ids) + int(end) - int(start) + 1 > MAX_BATCH_RESULTS:
+                    raise OverflowError
+                ids.extend(str(n) for n in range(int(start), int(end) + 1))
+            elif part.isdigit():
+                ids.append(part)
+            else:
+                raise ValueError(part)
+            if len(ids) > MAX_BATCH_RESULTS:
+                raise OverflowError
+    return list(dict.fromkeys(ids))
+
+
+def pack_messages(blocks, limit: int = TELEGRAM_MESSAGE_LIMIT, separator: str = "\n") -> list:
+    # بنجمع أكبر عدد من النتايج في كل رسالة من غير ما نعدي حد تيليجرام
+    messages, current = [], ""
+    for block in blocks:
+        block = block[:limit]
+        candidate = current + separator + block if current else block
+        if len(candidate) > limit:
+            messages.append(current)
+            current = block
+        else:
+            current = candidate
+    if current:
+        messages.append(current)
+    return messages
+
 
 def setup_admin_tools(bot_instance):
     app = bot_instance.app
-    admin_list = bot_instance.admin_list
-    user_student_map = bot_instance.user_student_map
-    student_usage = bot_instance.student_usage
+    permissions = bot_instance.permissions
+    links = bot_instance.links
+    stats = bot_instance.stats
     get_student_info_by_id = bot_instance.get_student_info_by_id
+    catalog = bot_instance.catalog
+    broadcaster = bot_instance.broadcaster
 
     # /broadcast
-    @app.on_message(filters.command("broadcast"))
+    @app.on_message(permissions.command("broadcast"))
     async def broadcast_command(client: Client, message: Message):
-        if message.from_user.id not in admin_list:
-            await message.reply("❌ الأمر ده مخصص للإدمن فقط.")
-            return
-
         parts = message.text.split(maxsplit=1)
         if len(parts) < 2:
             await message.reply("❗ استخدم الأمر كده:\n/broadcast رسالتك هنا")
             return
 
-        msg = parts[1]
-        sent = 0
-        failed = 0
-        for uid in user_student_map.keys():
-            try:
-                await app.send_message(int(uid), f"📢 رسالة من الإدارة:\n\n{msg}")
-                sent += 1
-            except:
-                failed += 1
+        if broadcaster.running:
+            await message.reply("⏳ في رسالة جماعية شغالة دلوقتي، استنى لما تخلص.")
+            return
 
-        await message.reply(f"✅ تم الإرسال لـ {sent} مستخدم.\n❌ فشل الإرسال لـ {failed}.")
+        msg = parts[1]
+        user_ids = await bot_instance.run_state(links.user_ids)
+        await broadcaster.start(message.chat.id, f"📢 رسالة من الإدارة:\n\n{msg}", user_ids)
 
     # /stats
     # /stats
     # /stats
     # /stats
     # /stats
-    @app.on_message(filters.command("stats"))
+    @app.on_message(permissions.command("stats"))
     async def stats_command(client: Client, message: Message):
-        if message.from_user.id not in admin_list:
-            await message.reply("❌ الأمر ده مخصص للإدمن فقط.")
-            return
-
-        total_users = len(user_student_map)
-        total_lookups = sum([d.get("count", 0) for d in student_usage.values()])
-        top_users = sorted(student_usage.items(), key=lambda x: x[1].get("count", 0), reverse=True)[:5]
+        total_users = await bot_instance.run_state(len, links)
+        # offenders: محاولات غير مصرح بها (حتى لو تم منعهم من الوصول للنتائج)
+        total_lookups, top_users, offenders = await bot_instance.run_state(stats.snapshot)
 
         text = f"📊 **إحصائيات النظام:**\n\n"
         text += f"👥 عدد المستخدمين المرتبطين: `{total_users}`\n"
         text += f"📥 عدد مرات الاستعلام الكلي: `{total_lookups}`\n"
+        text += f"⏱️ تأخير الـ loop: آخر `{bot_instance.loop_lag.last_lag * 1000:.0f}ms` — أقصى `{bot_instance.loop_lag.max_lag * 1000:.0f}ms`\n"
         text += "\n🏆 **أكثر الطلاب تم البحث عنهم:**\n"
 
-        for sid, info in top_users:
-            count = info.get("count", 0)
+        for sid, count in top_users:
             name = (await get_student_info_by_id(sid)).get("name", "—")
             text += f"🔹 {name} (ID: `{sid}`) ➤ {count} مره\n"
 
-        # حساب محاولات غير مصرح بها (حتى لو تم منعهم من الوصول للنتائج)
-        abuse_attempts = {}
-
-        for student_id, info in student_usage.items():
-            for uid_raw, count in info.get("by", {}).items():
-                uid = str(uid_raw)
-                student_id = str(student_id)
-                linked_student_id = user_student_map.get(uid)
-
-                # لو المستخدم مرتبط بطالب آخر أو مش مرتبط نهائيًا
-                if linked_student_id != student_id:
-                    abuse_attempts[uid] = abuse_attempts.get(uid, 0) + count
-
-        # الترتيب حسب عدد المحاولات
-        offenders = sorted(abuse_attempts.items(), key=lambda x: x[1], reverse=True)
+        # /stats full ➤ توزيع الطلبات على الأيام والساعات
+        if len(message.command) > 1 and message.command[1] == "full":
+            series = await bot_instance.run_state(bot_instance.events.hour_counts, int(time.time() // 3600) - 7 * 24)
+            per_day, per_hour = stats.breakdown(series)
+            if per_day is not None:
+                text += "\n📅 **الطلبات آخر 7 أيام:**\n"
+                for day, count in per_day.items():
+                    text += f"🔹 {day.strftime('%Y-%m-%d')} ➤ {int(count)}\n"
+                text += "\n🕒 **الطلبات حسب الساعة:**\n"
+                for hour, count in per_hour.items():
+                    if count:
+                        text += f"🔹 {hour:02d}:00 ➤ {int(count)}\n"
 
         await message.reply(text)
 
         if offenders:
             offenders_to_show = []
+            offenders = [(uid, tries) for uid, tries in offenders if tries >= 5]  # تجاهل المحاولات القليلة
+            users = await bot_instance.profiles.get_many([uid for uid, _ in offenders])
             for uid, tries in offenders:
-                if tries < 5:
-                    continue  # تجاهل المحاولات القليلة
-                try:
-                    user = await client.get_users(int(uid))
+                user = users.get(int(uid))
+                if user is not None:
                     username = f"@{user.username}" if user.username else f"{user.first_name} {user.last_name or ''}".strip()
-                except:
+                else:
                     username = "مستخدم غير معروف"
                 offenders_to_show.append(f"🔸 {username} (`{uid}`) ➤ {tries} محاوله")
 
@@ -110,25 +145,19 @@ def setup_admin_tools(bot_instance):
 
 
     # /unlinktg <telegram_id>
-    @app.on_message(filters.command("unlinktg"))
+    @app.on_message(permissions.command("unlinktg"))
     async def unlink_by_telegram_id(client: Client, message: Message):
-        if message.from_user.id not in admin_list:
-            await message.reply("❌ الأمر ده مخصص للإدمن فقط.")
-            return
-
         parts = message.text.strip().split()
         if len(parts) != 2 or not parts[1].isdigit():
             await message.reply("❗ الاستخدام الصحيح:\n/unlinktg <telegram_user_id>")
             return
 
         target_id = parts[1]
-        if target_id not in user_student_map:
+        student_id = await bot_instance.run_state(bot_instance.unlink_user, target_id)
+        if student_id is None:
             await message.reply("❌ لا يوجد حساب مرتبط بهذا ID.")
             return
 
-        student_id = user_student_map.pop(target_id)
-        bot_instance.save_state()
-
         await message.reply(
             f"✅ تم فك الربط بين:\n"
             f"👤 Telegram ID: `{target_id}`\n"
@@ -145,32 +174,19 @@ def setup_admin_tools(bot_instance):
             pass
 
     # /unlink <student_id>
-    @app.on_message(filters.command("unlink"))
+    @app.on_message(permissions.command("unlink"))
     async def unlink_by_student_id(client: Client, message: Message):
-        if message.from_user.id not in admin_list:
-            await message.reply("❌ الأمر ده مخصص للإدمن فقط.")
-            return
-
         parts = message.text.strip().split()
         if len(parts) != 2:
             await message.reply("❗ الاستخدام الصحيح:\n/unlink <student_id>")
             return
 
         target_student_id = parts[1]
-        linked_user_id = None
-
-        for uid, sid in user_student_map.items():
-            if sid == target_student_id:
-                linked_user_id = uid
-                break
-
+        linked_user_id = await bot_instance.run_state(bot_instance.unlink_student, target_student_id)
         if not linked_user_id:
             await message.reply("❌ لا يوجد مستخدم مرتبط بهذا رقم الطالب.")
             return
 
-        user_student_map.pop(linked_user_id)
-        bot_instance.save_state()
-
         await message.reply(
             f"✅ تم فك الربط بين:\n"
             f"🎓 Student ID: `{target_student_id}`\n"
@@ -187,31 +203,17 @@ def setup_admin_tools(bot_instance):
             pass
 
     # /find <part of name>
-    @app.on_message(filters.command("find"))
+    @app.on_message(permissions.command("find"))
     async def find_student_command(client: Client, message: Message):
-        if message.from_user.id not in admin_list:
-            await message.reply("❌ الأمر ده مخصص للإدمن فقط.")
-            return
-
         parts = message.text.strip().split(maxsplit=1)
         if len(parts) != 2:
             await message.reply("❗ الاستخدام الصحيح:\n/find <جزء من اسم الطالب أو الاسم كامل>")
             return
 
-        search_terms = parts[1].lower().split()
-        matches = []
-
         try:
-            df = pd.read_excel("result.xlsx", sheet_name="Sheet1")
-            df.columns = df.columns.str.strip()
-            df.rename(columns={"ID": "id", "اسم الطالب": "Name"}, inplace=True)
-            df["id"] = df["id"].astype(str).str.strip().str.replace(".0", "", regex=False)
-            df["Name"] = df["Name"].astype(str)
-
-            for _, row in df.iterrows():
-                name = row["Name"].lower()
-                if all(term in name for term in search_terms):
-                    matches.append(f"👤 {row['Name']} — 🆔 `{row['id']}`")
+            snapshot = await bot_instance.get_results_snapshot()
+            index = await run_blocking(lambda: snapshot.name_index)
+            matches = [f"👤 {snapshot.names[sid]} — 🆔 `{sid}`" for sid in index.search(parts[1])]
 
             if not matches:
                 await message.reply("❌ لا يوجد نتائج لهذا البحث.")
@@ -236,12 +238,8 @@ def setup_admin_tools(bot_instance):
             await message.reply(f"❌ حصل خطأ أثناء البحث: {str(e)}")
 
     # /reset
-    @app.on_message(filters.command("reset"))
+    @app.on_message(permissions.command("reset"))
     async def reset_command(client: Client, message: Message):
-        if message.from_user.id not in admin_list:
-            await message.reply("❌ الأمر ده مخصص للإدمن فقط.")
-            return
-
         parts = message.text.strip().split()
         if len(parts) != 2:
             await message.reply("❗ الاستخدام الصحيح:\n/reset <password>")
@@ -252,9 +250,191 @@ def setup_admin_tools(bot_instance):
             await message.reply("❌ كلمة المرور غير صحيحة.")
             return
 
-        # Clear the in-memory data
-        user_student_map.clear()
-        student_usage.clear()
-        bot_instance.save_state()
+        await bot_instance.reset_state()
 
         await message.reply("✅ تم إعادة ضبط قاعدة البيانات بنجاح. يمكنك الآن إضافة نتائج جديدة.")
+
+    # /reload [الترم]
+    @app.on_message(permissions.command("reload"))
+    async def reload_command(client: Client, message: Message):
+        parts = message.text.strip().split()
+        key = parts[1] if len(parts) > 1 else None
+        try:
+            result_set, snapshot = await run_blocking(catalog.reload, key)
+        except Exception as e:
+            await message.reply(f"❌ حصل خطأ أثناء تحميل الشيت: {str(e)}")
+            return
+
+        await message.reply(
+            f"✅ تم تحميل الشيت `{result_set.key}` من جديد.\n"
+            f"📄 عدد الصفوف: `{len(snapshot.records)}`\n"
+            f"⏱️ وقت التحميل: `{snapshot.parse_time:.2f}` ثانية"
+        )
+
+    # /sets
+    @app.on_message(permissions.command("sets"))
+    async def sets_command(client: Client, message: Message):
+        text = "🗂️ **شيتات النتايج:**\n\n"
+        for key in catalog.keys():
+            result_set = catalog.get(key)
+            status = "🟢 محمل" if result_set.resident else "⚪ مش محمل"
+            rows = f"{len(result_set.ids)} طالب" if result_set.ids is not None else "—"
+            default = " ⭐" if key == catalog.default_key else ""
+            text += f"🔹 `{key}`{default} — {result_set.title}\n    {status} | {rows}\n"
+        text += "\nللاستعلام من شيت معين: /result <الترم> <رقم الجلوس>"
+        await message.reply(text)
+
+    # /attempts <telegram_id>
+    @app.on_message(permissions.command("attempts"))
+    async def attempts_command(client: Client, message: Message):
+        parts = message.text.strip().split()
+        if len(parts) != 2 or not parts[1].isdigit():
+            await message.reply("❗ الاستخدام الصحيح:\n/attempts <telegram_user_id>")
+            return
+
+        attempts = await bot_instance.run_state(bot_instance.attempts.by_user, parts[1])
+        if not attempts:
+            await message.reply("✅ مفيش محاولات مرفوضة للمستخدم ده.")
+            return
+
+        text = f"🚨 محاولات مرفوضة للمستخدم `{parts[1]}`:\n\n"
+        for sid, count in sorted(attempts.items(), key=lambda x: x[1], reverse=True)[:50]:
+            text += f"🔸 Student ID: `{sid}` ➤ {count} محاوله\n"
+        await message.reply(text)
+
+    # /history [days] أو /history hours ➤ عدد الطلبات بنتيجتها من سجل الأحداث
+    @app.on_message(permissions.command("history"))
+    async def history_command(client: Client, message: Message):
+        parts = message.text.strip().split()
+        events = bot_instance.events
+
+        def line(counts):
+            return (f"✅ {counts.get('success', 0)} | 🚫 {counts.get('conflict', 0)} | "
+                    f"❓ {counts.get('not_found', 0)} | ⏳ {counts.get('rate_limited', 0)}")
+
+        if len(parts) > 1 and parts[1] == "hours":
+            text = "🕒 **الطلبات آخر 24 ساعة:**\n\n"
+            for hour, counts in await bot_instance.run_state(events.hourly, 24):
+                if counts:
+                    text += f"🔹 {hour.strftime('%m-%d %H:00')} ➤ {line(counts)}\n"
+        else:
+            days = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 7
+            text = f"📅 **الطلبات آخر {days} يوم:**\n\n"
+            for day, counts in await bot_instance.run_state(events.history, days):
+                text += f"🔹 {day.strftime('%Y-%m-%d')} ➤ {line(counts)}\n"
+        text += "\n✅ نجاح | 🚫 كود مربوط بحد تاني | ❓ مش موجود | ⏳ طلبات كتير"
+        await message.reply(text)
+
+    # /export [links|usage|results] [csv|xlsx] [الترم]
+    @app.on_message(permissions.command("export"))
+    async def export_command(client: Client, message: Message):
+        args = message.command[1:]
+        kind = next((arg for arg in args if arg in EXPORT_KINDS), "links")
+        fmt = next((arg for arg in args if arg in EXPORT_FORMATS), "csv")
+        key = next((arg for arg in args if arg in catalog.sets), None)
+
+        # نسخة من الداتا الحية على الـ loop، والكتابة نفسها في thread
+        if kind == "links":
+            header, rows = ["telegram_id", "student_id"], await bot_instance.run_state(links.items)
+        elif kind == "usage":
+            # في وضع الـ workers العدادات الكاملة في state.db مش في ميموري الـ worker ده
+            usage = await run_blocking(bot_instance.storage.load_usage) if bot_instance.storage.shared else bot_instance.student_usage
+            header = ["student_id", "count", "last_time"]
+            rows = [(sid, info.get("count", 0), info.get("last_time")) for sid, info in usage.items()]
+        else:
+            result_set = catalog.get(key)
+            snapshot = await bot_instance.get_results_snapshot(result_set)
+            header, rows = result_rows(snapshot)
+
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+        os.close(fd)
+        try:
+            count = await run_blocking(write_export, path, fmt, header, rows)
+            file_name = f"{kind}{'_' + key if key else ''}_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+            await message.reply_document(path, file_name=file_name, caption=f"📦 {kind}: {count} صف")
+        except Exception as e:
+            await message.reply(f"❌ حصل خطأ أثناء التصدير: {str(e)}")
+        finally:
+            remove_quietly(path)
+
+    # /import [replace] ➤ رد على ملف CSV/XLSX فيه telegram_id و student_id
+    @app.on_message(permissions.command("import"))
+    async def import_command(client: Client, message: Message):
+        source = message if message.document else message.reply_to_message
+        if source is None or not source.document:
+            await message.reply("❗ ابعت ملف CSV أو XLSX (عمودين telegram_id و student_id) ومعاه /import، أو رد عليه بـ /import\n"
+                                "ضيف replace لو عايز الربط الجديد يمسح أي ربط متعارض.")
+            return
+
+        replace = "replace" in message.command[1:]
+        directory = tempfile.mkdtemp()
+        progress = await message.reply("⏳ جاري الاستيراد...")
+        try:
+            path = await client.download_media(source, file_name=directory + os.sep)
+            importer = LinkImport(path)
+            batches = importer.batches()
+            linked = conflicts = unchanged = 0
+            while True:
+                # كل دفعة بتتقرا في thread وتتطبق (على الـ loop، أو في thread في وضع الـ workers)، وبينهم الـ loop بيرد على الباقيين
+                batch = await run_blocking(next, batches, None)
+                if batch is None:
+                    break
+                added, conflicted, same = await bot_instance.run_state(bot_instance.import_links, batch, replace)
+                linked += added
+                conflicts += conflicted
+                unchanged += same
+                await asyncio.sleep(0)
+        except Exception as e:
+            await progress.edit_text(f"❌ حصل خطأ أثناء الاستيراد: {str(e)}")
+            return
+        finally:
+            for name in os.listdir(directory):
+                remove_quietly(os.path.join(directory, name))
+            os.rmdir(directory)
+
+        text = (
+            f"✅ تم الاستيراد ({importer.rows} صف):\n\n"
+            f"🔗 اتربط: {linked}\n"
+            f"♻️ كان مربوط كده أصلاً: {unchanged}\n"
+            f"⚠️ متعارض واتساب: {conflicts}\n"
+            f"🔁 مكرر في الملف: {importer.duplicates}\n"
+            f"❌ صفوف غلط: {importer.invalid}"
+        )
+        if importer.bad_lines:
+            text += f" (سطور: {', '.join(map(str, importer.bad_lines))})"
+        await progress.edit_text(text)
+
+    # /results [الترم] 101 102 103 أو 100-250 ➤ نتايج كتير مرة واحدة
+    @app.on_message(permissions.command("results"))
+    async def batch_results_command(client: Client, message: Message):
+        args = message.command[1:]
+        key = args.pop(0) if args and args[0] in catalog.sets else None
+        try:
+            student_ids = parse_student_ids(args)
+        except OverflowError:
+            await message.reply(f"❌ أقصى عدد في المرة الواحدة {MAX_BATCH_RESULTS} كود.")
+            return
+        except ValueError as e:
+            await message.reply(f"❌ `{e}` مش رقم جلوس ولا range صحيح.")
+            return
+        if not student_ids:
+            await message.reply("❗ الاستخدام الصحيح:\n/results 101 102 103\n/results 100-250\n/results <الترم> 100-250")
+            return
+
+        results = await bot_instance.get_student_results(student_ids, key)
+        missing = [sid for sid in student_ids if sid not in results]
+        summary = f"📋 لقينا {len(results)} من {len(student_ids)} كود"
+        if missing:
+            shown = ", ".join(missing[:50]) + (" ..." if len(missing) > 50 else "")
+            summary += f"\n❌ مش موجودين: {shown}"
+
+        blocks = [results[sid].strip() for sid in student_ids if sid in results]
+        if len(blocks) > BATCH_DOCUMENT_AFTER:
+            file = BytesIO("\n\n".join(blocks).replace("**", "").encode("utf-8"))
+            file.name = f"results_{student_ids[0]}-{student_ids[-1]}.txt"
+            await message.reply_document(file, caption=summary[:1024])
+            return
+
+        for text in pack_messages(blocks):
+            await message.reply(text)
+        await message.reply(summary)
@@ -0,0 +1,116 @@
+import time
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import Histogram
+
+BLOCKING_WORKERS = 4
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+STATE_WRITE_SECONDS = Histogram("bot_state_write_seconds", "Time spent persisting one state write")
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+class StateWriter:
+    # كاتب واحد للملفات: لو في كتابة مستنية لنفس الملف بناخد آخر نسخة بس
+    def __init__(self, write_func=None):
+        self.write_func = write_func
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-writer")
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.last_write_time = None
+        self.last_write_duration = 0.0
+        # عدد الكتابات اللي لسه ماتنفذتش، ومن امتى في حاجة مستنية (علشان /healthz)
+        self.backlog = 0
+        self.backlog_since = None
+
+    def _enqueue(self, func, *args):
+        with self._lock:
+            if self.backlog == 0:
+                self.backlog_since = time.time()
+            self.backlog += 1
+        self._executor.submit(self._run_job, func, *args)
+
+    def _run_job(self, func, *args):
+        try:
+            func(*args)
+        finally:
+            with self._lock:
+                self.backlog -= 1
+                self.backlog_since = time.time() if self.backlog else None
+
+    def staleness(self) -> float:
+        # قد ايه أقدم تعديل مستني يتكتب
+        since = self.backlog_since
+        return time.time() - since if since is not None else 0.0
+
+    def submit(self, filename, data):
+        with self._lock:
+            scheduled = filename in self._pending
+            self._pending[filename] = data
+        if not scheduled:
+            self._enqueue(self._write, filename)
+
+    def run(self, func, *args):
+        # عمليات بتتنفذ بالترتيب على نفس thread الكاتب (زي transactions الـ SQLite)
+        self._enqueue(self._timed, func, *args)
+
+    def _write(self, filename):
+        with self._lock:
+            data = self._pending.pop(filename)
+        self._timed(self.write_func, filename, data)
+
+    def _timed(self, func, *args):
+        started = time.perf_counter()
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"Error writing state: {e}")
+            return
+        self.last_write_duration = time.perf_counter() - started
+        self.last_write_time = time.time()
+        STATE_WRITE_SECONDS.observe(self.last_write_duration)
+
+    def flush(self):
+        self._executor.submit(lambda: None).result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class LoopLagMonitor:
+    # بيقيس الـ loop فضل واقف قد ايه بعد ما كان المفروض يصحى
+    def __init__(self, interval: float = 0.5, warn_after: float = 0.25):
+        self.interval = interval
+        self.warn_after = warn_after
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_blocked = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.total_blocked += lag
+            if lag > self.warn_after:
+                print(f"⚠️ Event loop blocked for {lag * 1000:.0f}ms")
@@ -0,0 +1,101 @@
+import asyncio
+import itertools
+from pyrogram import StopPropagation
+from pyrogram.handlers import MessageHandler
+from pyrogram.types import Message
+
+# بديل محلي لـ pyrogram Client/Message علشان نشغل الهاندلرز من غير تيليجرام
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.first_name = f"User{user_id}"
+        self.last_name = None
+        self.username = f"user{user_id}"
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class FakeMessage(Message):
+    # subclass من Message علشان filters بتاعة pyrogram (regex مثلاً) تقبلها
+    _ids = itertools.count(1)
+
+    def __init__(self, client, user_id: int, text: str):
+        self.id = next(self._ids)
+        self.client = client
+        self.from_user = FakeUser(user_id)
+        self.chat = FakeChat(user_id)
+        self.text = text
+        self.caption = None
+        self.document = None
+        self.reply_to_message = None
+        self.command = None
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return await self.client.send_message(self.chat.id, text)
+
+    reply = reply_text
+
+    async def reply_document(self, document, **kwargs):
+        self.replies.append(("document", getattr(document, "name", None)))
+        return await self.client.send_message(self.chat.id, kwargs.get("caption", ""))
+
+
+class FakeClient:
+    # بيسجل الهاندلرز بتاعة on_message/add_handler ويوزع الرسايل عليهم زي الـ dispatcher بتاع pyrogram
+    def __init__(self, *args, send_latency: float = 0.0, flood_every: int = 0, **kwargs):
+        self.send_latency = send_latency
+        self.flood_every = flood_every
+        self.me = FakeUser(0)
+        self.groups = {}
+        self.sent = 0
+        self.edited = 0
+
+    def add_handler(self, handler, group: int = 0):
+        self.groups.setdefault(group, []).append(handler)
+        self.groups = dict(sorted(self.groups.items()))
+
+    def remove_handler(self, handler, group: int = 0):
+        self.groups[group].remove(handler)
+
+    def on_message(self, message_filter=None, group: int = 0):
+        def decorator(func):
+            self.add_handler(MessageHandler(func, message_filter), group)
+            return func
+        return decorator
+
+    async def dispatch(self, message: FakeMessage):
+        # كل group بيشغل أول هاندلر يوافق، والـ groups بالترتيب، وStopPropagation بيوقف الباقي
+        for handlers in list(self.groups.values()):
+            for handler in list(handlers):
+                if handler.filters is None or await handler.filters(self, message):
+                    try:
+                        await handler.callback(self, message)
+                    except StopPropagation:
+                        return
+                    break
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        self.sent += 1
+        if self.flood_every and self.sent % self.flood_every == 0:
+            from pyrogram.errors import FloodWait
+            raise FloodWait(value=1)
+        return FakeMessage(self, int(chat_id), text)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.edited += 1
+
+    async def get_users(self, user_ids):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        if isinstance(user_ids, (list, tuple, set)):
+            return [FakeUser(int(uid)) for uid in user_ids]
+        return FakeUser(int(user_ids))
@@ -0,0 +1,191 @@
+# بنشمارك لهاندلرز البوت على شيتات صناعية من غير تيليجرام:
+#   python bench/run.py --rows 1000 10000 100000 --users 2000 --concurrency 200
+# كل حجم شيت بيشتغل في بروسس لوحده علشان الـ peak RSS يبقى بتاعه هو بس
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import shutil
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(BENCH_DIR, '.data')
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1] * 1000}
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def drive(bot, messages: list, concurrency: int) -> dict:
+    # كل رسالة بتعدي على نفس الـ dispatch اللي pyrogram كان هيعمله، والـ latency من أول الهاندلر لآخره
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(message):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.app.dispatch(message)
+            latencies.append(time.perf_counter() - started)
+
+    bot.loop_lag.max_lag = 0.0
+    started = time.perf_counter()
+    await asyncio.gather(*[one(message) for message in messages])
+    wall = time.perf_counter() - started
+    return {
+        "requests": len(messages),
+        "wall_s": wall,
+        "throughput": len(messages) / wall if wall else 0.0,
+        "max_loop_lag_ms": bot.loop_lag.max_lag * 1000,
+        **percentiles(latencies),
+    }
+
+
+async def bench(args) -> dict:
+    os.environ.setdefault("API_ID", "1")
+    os.environ.setdefault("API_HASH", "bench")
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    os.environ["STATE_BACKEND"] = args.backend
+    os.environ["BROADCAST_RATE"] = str(args.broadcast_rate)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, BENCH_DIR)
+
+    from fake_telegram import FakeClient, FakeMessage
+    from workbook import ensure_workbook
+
+    workbook = ensure_workbook(os.path.join(DATA_DIR, f"results_{args.single}.xlsx"), args.single)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.chdir(workdir)
+    with open('result_sets.json', 'w', encoding='utf-8') as f:
+        json.dump({"default": "bench", "sets": [{
+            "key": "bench", "file": workbook, "semester": "bench",
+            "subjects": {name: name for name in ("Dermatology", "ENT", "Family medicine", "Radiology")},
+            "total_column": "Total", "percentage_column": "percentage",
+        }]}, f)
+
+    import main
+
+    main.Client = lambda *a, **kw: FakeClient(send_latency=args.send_latency)
+    report = {"rows": args.single, "backend": args.backend}
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    bot = main.StudentResultBot()
+    report["init_s"] = time.perf_counter() - started
+    # البوت بيحمل الشيت بعد ما يتصل (preload_results)، فهنا بنحمله بإيدينا
+    store = bot.catalog.default.store
+    report["excel_parse_s"] = bot.catalog.snapshot(bot.catalog.default).parse_time
+    report["snapshot_load_s"] = store.load().parse_time
+    report["rss_after_load_mb"] = peak_rss_mb()
+    report["rss_before_mb"] = rss_before
+
+    rng = random.Random(11)
+    admin_id = main.INITIAL_ADMIN_ID
+    student_ids = list(store.snapshot.records)
+    users = [10_000_000 + i for i in range(args.users)]
+    seats = [student_ids[i % len(student_ids)] for i in range(args.users)]
+    names = list(store.snapshot.names.values())
+
+    # بنقيس الـ lag كل 10ms بدل نص ثانية علشان الفترات القصيرة تبان
+    bot.loop_lag.interval = 0.01
+    bot.loop_lag.start()
+    phases = report["phases"] = {}
+    phases["result_first"] = await drive(bot, [FakeMessage(bot.app, u, s) for u, s in zip(users, seats)], args.concurrency)
+    phases["result_repeat"] = await drive(bot, [FakeMessage(bot.app, u, f"/result {s}") for u, s in zip(users, seats)], args.concurrency)
+    phases["result_conflict"] = await drive(
+        bot, [FakeMessage(bot.app, 20_000_000 + i, s) for i, s in enumerate(seats)], args.concurrency)
+    phases["find"] = await drive(bot, [
+        FakeMessage(bot.app, admin_id, "/find " + " ".join(rng.choice(names).split()[:2]))
+        for _ in range(args.queries)
+    ], args.concurrency)
+    phases["stats"] = await drive(bot, [FakeMessage(bot.app, admin_id, "/stats") for _ in range(args.queries)], args.concurrency)
+    phases["stats_full"] = await drive(bot, [FakeMessage(bot.app, admin_id, "/stats full") for _ in range(5)], 1)
+
+    bot.loop_lag.max_lag = 0.0
+    sent_before = bot.app.sent
+    started = time.perf_counter()
+    await bot.app.dispatch(FakeMessage(bot.app, admin_id, "/broadcast bench"))
+    while bot.broadcaster.running:
+        await asyncio.sleep(0.01)
+    wall = time.perf_counter() - started
+    phases["broadcast"] = {
+        "requests": bot.app.sent - sent_before,
+        "wall_s": wall,
+        "throughput": (bot.app.sent - sent_before) / wall if wall else 0.0,
+        "max_loop_lag_ms": bot.loop_lag.max_lag * 1000,
+    }
+
+    bot.loop_lag.stop()
+    bot.usage_buffer.stop()
+    bot.writer.close()
+    bot.storage.close()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    report["loop_blocked_total_s"] = bot.loop_lag.total_blocked
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n=== {report['rows']:,} rows ({report['backend']}) ===")
+    print(f"init {report['init_s']:.2f}s | excel parse {report['excel_parse_s']:.2f}s | "
+          f"snapshot load {report['snapshot_load_s'] * 1000:.0f}ms | peak RSS {report['peak_rss_mb']:.0f}MB "
+          f"(after load {report['rss_after_load_mb']:.0f}MB) | loop blocked {report['loop_blocked_total_s'] * 1000:.0f}ms")
+    print(f"{'phase':<16}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'max lag ms':>12}")
+    for name, phase in report["phases"].items():
+        print(f"{name:<16}{phase['requests']:>7}{phase.get('p50', 0):>10.2f}{phase.get('p95', 0):>10.2f}"
+              f"{phase.get('p99', 0):>10.2f}{phase['throughput']:>10.0f}{phase['max_loop_lag_ms']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark StudentResultBot handlers with a fake Telegram client")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--users", type=int, default=2000, help="students hitting /result")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200, help="/find and /stats calls")
+    parser.add_argument("--send-latency", type=float, default=0.02, help="simulated Telegram round trip (s)")
+    parser.add_argument("--broadcast-rate", type=float, default=1000)
+    parser.add_argument("--backend", choices=["json", "sqlite", "shared"], default="json")
+    parser.add_argument("--json", help="write the raw results to this file")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(asyncio.run(bench(args))))
+        return
+
+    reports = []
+    for rows in args.rows:
+        child = [
+            sys.executable, os.path.abspath(__file__), "--single", str(rows),
+            "--users", str(args.users), "--concurrency", str(args.concurrency), "--queries", str(args.queries),
+            "--send-latency", str(args.send_latency), "--broadcast-rate", str(args.broadcast_rate),
+            "--backend", args.backend,
+        ]
+        output = subprocess.run(child, capture_output=True, text=True, check=True).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
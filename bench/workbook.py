@@ -0,0 +1,45 @@
+import os
+import random
+
+# شيت نتيجة صناعي بنفس أعمدة result.xlsx بأي عدد صفوف
+FIRST_NAMES = [
+    "محمد", "أحمد", "محمود", "مصطفى", "إبراهيم", "يوسف", "عمر", "علي", "حسن", "خالد",
+    "كريم", "عبدالله", "عبدالرحمن", "مريم", "فاطمة", "آية", "سارة", "نورهان", "هدى", "إسراء",
+    "منة", "ياسمين", "شيماء", "رحمة", "زينب", "ندى", "سلمى", "هاجر", "أسماء", "دعاء",
+]
+FAMILY_NAMES = [
+    "السيد", "عبدالعزيز", "الشافعي", "المصري", "البنا", "الجمال", "حسنين", "عبدالغفار", "النجار", "الشربيني",
+    "فتحي", "رمضان", "سليمان", "عطية", "منصور", "شعبان", "الحداد", "عيسى", "بدوي", "الفقي",
+]
+SUBJECTS = {"Dermatology": 50, "ENT": 100, "Family medicine": 150, "Radiology": 150}
+
+
+def random_name(rng: random.Random) -> str:
+    parts = [rng.choice(FIRST_NAMES)] + [rng.choice(FIRST_NAMES[:12]) for _ in range(2)] + [rng.choice(FAMILY_NAMES)]
+    return " ".join(parts)
+
+
+def build_rows(rows: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    records = []
+    for student_id in range(1, rows + 1):
+        grades = {subject: round(rng.uniform(0.5, 1.0) * full, 1) for subject, full in SUBJECTS.items()}
+        total = round(sum(grades.values()), 1)
+        records.append({
+            "ID": student_id,
+            "Name": random_name(rng),
+            **grades,
+            "Total": total,
+            "percentage": total / sum(SUBJECTS.values()) * 100,
+        })
+    return records
+
+
+def ensure_workbook(path: str, rows: int) -> str:
+    # الشيتات الكبيرة بتاخد وقت تتكتب، فبنحتفظ بيها بين المرات
+    if not os.path.exists(path):
+        import pandas as pd
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        pd.DataFrame(build_rows(rows)).to_excel(path, sheet_name="Sheet1", index=False)
+    return path
@@ -0,0 +1,184 @@
+import time
+import asyncio
+from datetime import datetime
+from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated, PeerIdInvalid, UserDeactivated
+from storage import load_json
+from metrics import Counter, Histogram
+
+# أخطاء مش هتتصلح لو عيدنا المحاولة
+PERMANENT_ERRORS = (UserIsBlocked, InputUserDeactivated, PeerIdInvalid, UserDeactivated)
+
+BROADCAST_SENDS = Counter("bot_broadcast_sends_total", "Broadcast send attempts by status")
+BROADCAST_SEND_SECONDS = Histogram("bot_broadcast_send_seconds", "Latency of a single broadcast send_message call")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        # بعد FloodWait محدش يبعت لحد ما المدة تخلص
+        self.tokens = -seconds * self.rate
+        self.updated = time.monotonic()
+
+
+class BroadcastEngine:
+    # إرسال متوازي بحد أقصى للسرعة، والتقدم بيتحفظ علشان يكمل بعد الريستارت
+    def __init__(self, app, writer, state_file, rate: float = 25, concurrency: int = 10,
+                 max_retries: int = 3, progress_interval: float = 3.0):
+        self.app = app
+        self.writer = writer
+        self.state_file = state_file
+        self.bucket = TokenBucket(rate, rate)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.job = None
+        self.flood_waits = 0
+        self._task = None
+        self._done = set()
+        self._started = 0.0
+        self._processed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def remaining(self) -> list:
+        return [uid for uid in self.job["remaining"] if uid not in self._done]
+
+    def save(self):
+        if self.job is not None:
+            self.writer.submit(self.state_file, dict(self.job, remaining=self.remaining()))
+
+    async def start(self, chat_id, text: str, user_ids):
+        progress = await self.app.send_message(chat_id, "📢 جاري تجهيز الإرسال...")
+        self.job = {
+            "status": "running",
+            "chat_id": chat_id,
+            "progress_message_id": progress.id,
+            "text": text,
+            "remaining": [str(uid) for uid in user_ids],
+            "sent": 0,
+            "failed": 0,
+            "started_at": datetime.now().isoformat(),
+        }
+        self._launch()
+
+    async def resume(self):
+        job = load_json(self.state_file, None)
+        if not job or job.get("status") != "running" or not job.get("remaining"):
+            return
+        self.job = job
+        print(f"📢 Resuming broadcast: {len(job['remaining'])} users remaining")
+        self._launch()
+
+    def _launch(self):
+        self._done = set()
+        self._processed = 0
+        self._started = time.monotonic()
+        self.save()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.running:
+            self._task.cancel()
+            self.save()
+
+    async def _run(self):
+        queue = asyncio.Queue()
+        for uid in self.job["remaining"]:
+            queue.put_nowait(uid)
+
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(self._report_loop())
+        try:
+            await queue.join()
+        finally:
+            for task in workers + [reporter]:
+                task.cancel()
+
+        self.job["status"] = "done"
+        self.save()
+        await self.report()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            uid = await queue.get()
+            try:
+                delivered = await self._deliver(uid)
+                self.job["sent" if delivered else "failed"] += 1
+                self._done.add(uid)
+                self._processed += 1
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, uid) -> bool:
+        attempt = 0
+        while attempt <= self.max_retries:
+            await self.bucket.acquire()
+            try:
+                with BROADCAST_SEND_SECONDS.time():
+                    await self.app.send_message(int(uid), self.job["text"])
+                BROADCAST_SENDS.inc(status="sent")
+                return True
+            except FloodWait as e:
+                self.flood_waits += 1
+                BROADCAST_SENDS.inc(status="flood_wait")
+                self.bucket.pause(e.value)
+                await asyncio.sleep(e.value)
+            except PERMANENT_ERRORS:
+                BROADCAST_SENDS.inc(status="failed")
+                return False
+            except Exception:
+                BROADCAST_SENDS.inc(status="error")
+                attempt += 1
+                await asyncio.sleep(min(2 ** attempt, 30))
+        return False
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self.save()
+            await self.report()
+
+    def progress_text(self) -> str:
+        sent, failed = self.job["sent"], self.job["failed"]
+        remaining = len(self.job["remaining"]) - len(self._done)
+        if self.job["status"] == "done":
+            return f"✅ تم الإرسال لـ {sent} مستخدم.\n❌ فشل الإرسال لـ {failed}."
+
+        elapsed = time.monotonic() - self._started
+        if self._processed and elapsed > 0:
+            eta = int(remaining / (self._processed / elapsed))
+            eta_text = f"{eta // 60:02d}:{eta % 60:02d}"
+        else:
+            eta_text = "—"
+        return (
+            "📢 جاري الإرسال...\n\n"
+            f"✅ اتبعت: {sent}\n"
+            f"❌ فشل: {failed}\n"
+            f"⏳ متبقي: {remaining}\n"
+            f"🕒 الوقت المتوقع: {eta_text}"
+        )
+
+    async def report(self):
+        try:
+            await self.app.edit_message_text(self.job["chat_id"], self.job["progress_message_id"], self.progress_text())
+        except Exception:
+            pass
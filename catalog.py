@@ -0,0 +1,169 @@
+import os
+import time
+import json
+import threading
+from typing import Optional
+from result_store import ResultStore, normalize_student_id, file_signature
+
+
+class ResultSet:
+    # شيت نتيجة واحد (ترم/دفعة) ومعاه وصف الأعمدة بتاعته
+    def __init__(self, config: dict, cache_dir: str):
+        self.key = config["key"]
+        self.title = config.get("title", self.key)
+        self.semester = config.get("semester", self.title)
+        self.subjects = config.get("subjects", {})
+        self.total_column = config.get("total_column")
+        self.percentage_column = config.get("percentage_column")
+        self.config = config
+        schema = {k: config[k] for k in ("layout", "header_row", "id_column", "name_column", "id_pattern") if k in config}
+        self.store = ResultStore(config["file"], config.get("sheet", "Sheet1"), cache_dir, schema, cache_name=self.key)
+        # الأكواد بتفضل في الميموري حتى بعد ما الشيت نفسه يتشال، علشان نعرف الطالب في أنهي شيت
+        self.ids = None
+        self.ids_digest = None
+        self.ids_signature = None
+
+    @property
+    def resident(self) -> bool:
+        return self.store.loaded
+
+    def snapshot(self):
+        return self._remember_ids(self.store.current())
+
+    def peek(self):
+        snapshot = self.store.peek()
+        return self._remember_ids(snapshot) if snapshot is not None else None
+
+    def _remember_ids(self, snapshot):
+        if self.ids is None or self.ids_digest != snapshot.digest:
+            self.ids = frozenset(snapshot.records)
+            self.ids_digest = snapshot.digest
+            self.ids_signature = snapshot.signature
+        return snapshot
+
+    def forget_stale_ids(self):
+        # الملف اتغير وهو مش محمل: ننسى الأكواد القديمة ونحمله تاني وقت الحاجة
+        if self.ids is not None and os.path.exists(self.store.path) and file_signature(self.store.path) != self.ids_signature:
+            self.ids = None
+
+    def may_contain(self, student_id: str) -> bool:
+        return self.ids is None or student_id in self.ids
+
+
+class ResultCatalog:
+    # كل شيتات النتايج: بتتحمل وقت الحاجة، وأقل واحد اتستخدم بيتشال لما نعدي max_resident
+    def __init__(self, config_file: str, cache_dir: str, fallback: dict = None,
+                 max_resident: int = 2, idle_ttl: float = 1800):
+        self.config_file = config_file
+        self.cache_dir = cache_dir
+        self.fallback = fallback
+        self.max_resident = max_resident
+        self.idle_ttl = idle_ttl
+        self.sets = {}
+        self.default_key = None
+        self._config_signature = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self.load_config()
+
+    def read_config(self) -> dict:
+        if os.path.exists(self.config_file):
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {"default": self.fallback["key"], "sets": [self.fallback]}
+
+    def load_config(self):
+        config = self.read_config()
+        with self._lock:
+            sets = {}
+            for entry in config["sets"]:
+                current = self.sets.get(entry["key"])
+                # لو الإعدادات ماتغيرتش بنحتفظ بالشيت المحمل
+                sets[entry["key"]] = current if current is not None and current.config == entry else ResultSet(entry, self.cache_dir)
+            self.sets = sets
+            self.default_key = config.get("default") or next(iter(sets))
+        if os.path.exists(self.config_file):
+            self._config_signature = os.stat(self.config_file).st_mtime_ns
+
+    @property
+    def default(self) -> ResultSet:
+        return self.sets[self.default_key]
+
+    def get(self, key: str = None) -> Optional[ResultSet]:
+        return self.sets.get(key or self.default_key)
+
+    def keys(self) -> list:
+        return list(self.sets)
+
+    def ordered(self) -> list:
+        # الشيت الافتراضي الأول وبعده الباقي بترتيب الإعدادات
+        return [self.default] + [s for k, s in self.sets.items() if k != self.default_key]
+
+    def candidates(self, student_id: str) -> list:
+        # أي شيت ممكن يكون فيه الكود ده
+        student_id = normalize_student_id(student_id)
+        return [result_set for result_set in self.ordered() if result_set.may_contain(student_id)]
+
+    def snapshot(self, result_set: ResultSet):
+        snapshot = result_set.snapshot()
+        self.evict(keep=result_set)
+        return snapshot
+
+    def peek(self, result_set: ResultSet):
+        # من غير تحميل: None معناها إن الشيت مش في الميموري (أو اتشال من شوية) ولازم يتحمل في thread
+        return result_set.peek()
+
+    def reload(self, key: str = None):
+        self.load_config()
+        result_set = self.get(key)
+        if result_set is None:
+            raise KeyError(f"مفيش شيت باسم {key}")
+        result_set.store.load(force=True)
+        return result_set, self.snapshot(result_set)
+
+    def evict(self, keep: ResultSet = None):
+        now = time.monotonic()
+        pinned = {self.default_key} | ({keep.key} if keep is not None else set())
+        resident = [s for s in self.sets.values() if s.resident and s.key not in pinned]
+        resident.sort(key=lambda s: s.store.last_used, reverse=True)
+        room = max(self.max_resident - len(pinned), 0)
+        for position, result_set in enumerate(resident):
+            if position >= room or now - result_set.store.last_used > self.idle_ttl:
+                result_set.store.unload()
+
+    def config_changed(self) -> bool:
+        if not os.path.exists(self.config_file):
+            return False
+        return os.stat(self.config_file).st_mtime_ns != self._config_signature
+
+    def start_watcher(self, interval: float = 5.0):
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                if self.config_changed():
+                    self.load_config()
+                    print(f"🔄 Reloaded result catalog: {', '.join(self.keys())}")
+                for result_set in list(self.sets.values()):
+                    if result_set.resident:
+                        result_set.store.check_reload()
+                    else:
+                        result_set.forget_stale_ids()
+                self.evict()
+            except Exception as e:
+                print(f"Error watching result catalog: {e}")
+
+
+if __name__ == "__main__":
+    # خطوة البيلد: python catalog.py [result_sets.json]
+    import sys
+
+    catalog = ResultCatalog(sys.argv[1] if len(sys.argv) > 1 else 'result_sets.json', '.cache')
+    for result_set in catalog.sets.values():
+        snapshot = result_set.store.load(force=True)
+        print(f"✅ {result_set.key} ({result_set.store.path}): {len(snapshot.records)} rows -> snapshot {snapshot.digest[:12]} in {snapshot.parse_time:.2f}s")
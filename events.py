@@ -0,0 +1,265 @@
+import os
+import glob
+import time
+import asyncio
+from datetime import datetime, timedelta
+from storage import load_json, save_json
+from ratelimit import AttemptLog, SharedAttemptLog
+from metrics import Histogram
+
+SUCCESS = "success"
+CONFLICT = "conflict"
+NOT_FOUND = "not_found"
+RATE_LIMITED = "rate_limited"
+OUTCOMES = (SUCCESS, CONFLICT, NOT_FOUND, RATE_LIMITED)
+
+EVENT_APPEND_SECONDS = Histogram("bot_event_log_append_seconds", "Time spent appending one batch of events to the log segment")
+EVENT_COMPACT_SECONDS = Histogram("bot_event_log_compact_seconds", "Time spent writing the compacted event summary")
+
+
+class UsageEventLog:
+    # كل طلب بيتسجل كسطر في آخر ملف (timestamp, telegram_id, student_id, outcome) من غير ما نعيد كتابة حاجة،
+    # وكل فترة السجل بيتضغط في <prefix>.json (العدادات + المحاولات المرفوضة + عدد الطلبات لكل ساعة)
+    # ونبدأ segment جديد. وقت التشغيل بنقرا الملخص ونعيد تشغيل الـ segments اللي بعده بس
+    def __init__(self, writer, prefix: str, usage: dict, journal_usage: bool = True, flush_interval: float = 10.0,
+                 flush_every: int = 200, compact_bytes: int = 1 << 20, retention_days: int = 90):
+        self.writer = writer
+        self.prefix = prefix
+        self.summary_file = prefix + '.json'
+        self.usage = usage
+        # في SQLite العدادات بتتحفظ في الداتابيز، فالسجل هنا للتاريخ والمحاولات المرفوضة بس
+        self.journal_usage = journal_usage
+        # السطور بتتكتب كل flush_interval ثانية أو كل flush_every حدث، فأقصى حاجة تضيع لو البروسس وقع محدودة بالاتنين
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.compact_bytes = compact_bytes
+        self.retention_hours = retention_days * 24
+        self.attempts = AttemptLog()
+        self.series = {}
+        self.segment = 0
+        self.segment_bytes = 0
+        self.pending = []
+        self._task = None
+
+    def segment_file(self, segment: int) -> str:
+        return f"{self.prefix}.{segment}.log"
+
+    def segments(self) -> list:
+        found = []
+        for path in glob.glob(glob.escape(self.prefix) + '.*.log'):
+            number = path[len(self.prefix) + 1:-len('.log')]
+            if number.isdigit():
+                found.append(int(number))
+        return sorted(found)
+
+    def load(self):
+        summary = load_json(self.summary_file, None)
+        if summary is not None:
+            self.segment = summary["segment"]
+            if self.journal_usage:
+                # الملخص بيحل محل student_usage.json القديم
+                self.usage.clear()
+                self.usage.update(summary.get("usage", {}))
+            for bucket, counts in summary.get("attempts", {}).items():
+                self.attempts.buckets[int(bucket)] = {tuple(key.split(':', 1)): n for key, n in counts.items()}
+            self.series = {int(hour): counts for hour, counts in summary.get("series", {}).items()}
+
+        replayed = 0
+        for segment in self.segments():
+            if segment < self.segment:
+                # اتضغط قبل كده بس الملف ماتمسحش
+                os.remove(self.segment_file(segment))
+                continue
+            self.segment = segment
+            with open(self.segment_file(segment), 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) != 4:
+                        continue  # سطر ناقص من آخر مرة البروسس وقع فيها
+                    self._fold(float(parts[0]), parts[1], parts[2], parts[3], replay=True)
+                    replayed += 1
+            self.segment_bytes = os.path.getsize(self.segment_file(segment))
+        return replayed
+
+    def _fold(self, timestamp: float, user_id: str, student_id: str, outcome: str, replay: bool = False):
+        hour = int(timestamp // 3600)
+        counts = self.series.get(hour)
+        if counts is None:
+            counts = self.series[hour] = {}
+            oldest = hour - self.retention_hours
+            for stale in [h for h in self.series if h <= oldest]:
+                del self.series[stale]
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+        if outcome == CONFLICT:
+            self.attempts.record(user_id, student_id, timestamp)
+        elif outcome == SUCCESS and (self.journal_usage or not replay):
+            usage = self.usage.get(student_id)
+            if usage is None:
+                usage = self.usage[student_id] = {"count": 0}
+            usage["count"] += 1
+            usage["last_time"] = datetime.fromtimestamp(timestamp).isoformat()
+            return usage
+
+    def record(self, outcome: str, user_id, student_id, timestamp: float = None):
+        timestamp = timestamp or time.time()
+        user_id, student_id = str(user_id), str(student_id or '')
+        self.pending.append(f"{timestamp:.3f}\t{user_id}\t{student_id}\t{outcome}\n")
+        if len(self.pending) >= self.flush_every:
+            self._write_pending()
+        return self._fold(timestamp, user_id, student_id, outcome)
+
+    def _write_pending(self):
+        if self.pending:
+            data = ''.join(self.pending)
+            self.pending = []
+            self.segment_bytes += len(data.encode('utf-8'))
+            self.writer.run(self._append, self.segment_file(self.segment), data)
+
+    def flush(self):
+        self._write_pending()
+        if self.segment_bytes >= self.compact_bytes:
+            self.compact()
+
+    @staticmethod
+    @EVENT_APPEND_SECONDS.timed
+    def _append(path: str, data: str):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(data)
+
+    def summary(self) -> dict:
+        summary = {
+            "segment": self.segment,
+            "attempts": {
+                str(bucket): {f"{uid}:{sid}": n for (uid, sid), n in counts.items()}
+                for bucket, counts in self.attempts.buckets.items()
+            },
+            "series": {str(hour): dict(counts) for hour, counts in self.series.items()},
+        }
+        if self.journal_usage:
+            summary["usage"] = {sid: dict(usage) for sid, usage in self.usage.items()}
+        return summary
+
+    def compact(self):
+        # الملخص بيتكتب بالـ segment الجديد قبل ما القديم يتمسح، فلو البروسس وقع في النص مفيش حاجة بتتعد مرتين
+        self._write_pending()
+        old_segment = self.segment
+        self.segment += 1
+        self.segment_bytes = 0
+        self.writer.run(self._write_summary, self.summary(), old_segment)
+
+    @EVENT_COMPACT_SECONDS.timed
+    def _write_summary(self, summary: dict, old_segment: int):
+        save_json(self.summary_file, summary)
+        for segment in range(old_segment, -1, -1):
+            path = self.segment_file(segment)
+            if not os.path.exists(path):
+                break
+            os.remove(path)
+
+    def reset(self):
+        self.pending = []
+        self.usage.clear()
+        self.attempts.buckets.clear()
+        self.series.clear()
+        self.compact()
+
+    def history(self, days: int = 7) -> list:
+        # [(اليوم, {outcome: عدد})] لآخر days يوم بالتوقيت المحلي لحد النهارده، حتى الأيام اللي مفيهاش طلبات
+        days = max(1, min(days, self.retention_hours // 24))
+        today = datetime.now().date()
+        per_day = {today - timedelta(days=offset): {} for offset in range(days - 1, -1, -1)}
+        first_hour = int(time.mktime(min(per_day).timetuple()) // 3600)
+        for hour, counts in self.hour_counts(first_hour).items():
+            bucket = per_day.get(datetime.fromtimestamp(hour * 3600).date())
+            if bucket is None:
+                continue
+            for outcome, n in counts.items():
+                bucket[outcome] = bucket.get(outcome, 0) + n
+        return list(per_day.items())
+
+    def hourly(self, hours: int = 24) -> list:
+        current = int(time.time() // 3600)
+        series = self.hour_counts(current - hours + 1)
+        return [(datetime.fromtimestamp(hour * 3600), series.get(hour, {})) for hour in range(current - hours + 1, current + 1)]
+
+    def hour_counts(self, since_hour: int) -> dict:
+        # {ساعة: {outcome: عدد}} من since_hour لحد دلوقتي
+        return {hour: dict(counts) for hour, counts in list(self.series.items()) if hour >= since_hour}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+
+class SharedUsageEventLog(UsageEventLog):
+    # وضع الـ workers: كل worker بيكتب سطوره في segments خاصة بيه زي العادي، وكمان بيزود عدادات الساعات
+    # والمحاولات المرفوضة في state.db مع كل flush، فـ /history و /attempts و /stats بيشوفوا طلبات كل الـ workers.
+    # الاستعلامات بتقرا من الداتابيز فلازم تتنادى برا الـ loop
+    HOUR_INCREMENT = (
+        "INSERT INTO event_hours (hour, outcome, count) VALUES (?, ?, ?) "
+        "ON CONFLICT(hour, outcome) DO UPDATE SET count = event_hours.count + excluded.count"
+    )
+    ATTEMPT_INCREMENT = (
+        "INSERT INTO attempts (bucket, telegram_id, student_id, count) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(bucket, telegram_id, student_id) DO UPDATE SET count = attempts.count + excluded.count"
+    )
+
+    def __init__(self, storage, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.storage = storage
+        self.attempts = SharedAttemptLog(storage)
+        self.hour_deltas = {}
+
+    def load(self):
+        replayed = super().load()
+        # السطور اللي اتعادت اتكتبت في state.db مع نفس الـ flush، فماتتحسبش تاني
+        self.attempts.pending = {}
+        return replayed
+
+    def record(self, outcome: str, user_id, student_id, timestamp: float = None):
+        timestamp = timestamp or time.time()
+        key = (int(timestamp // 3600), outcome)
+        self.hour_deltas[key] = self.hour_deltas.get(key, 0) + 1
+        return super().record(outcome, user_id, student_id, timestamp)
+
+    def _write_pending(self):
+        super()._write_pending()
+        statements = [(self.HOUR_INCREMENT, (hour, outcome, n)) for (hour, outcome), n in self.hour_deltas.items()]
+        statements += [(self.ATTEMPT_INCREMENT, (bucket, uid, sid, n)) for (bucket, uid, sid), n in self.attempts.pending.items()]
+        self.hour_deltas, self.attempts.pending = {}, {}
+        if statements:
+            self.writer.run(self.storage.transaction, statements)
+
+    def compact(self):
+        super().compact()
+        oldest_hour = int(time.time() // 3600) - self.retention_hours
+        self.writer.run(self.storage.transaction, [
+            ("DELETE FROM event_hours WHERE hour <= ?", (oldest_hour,)),
+            ("DELETE FROM attempts WHERE bucket <= ?", (self.attempts.oldest_bucket(),)),
+        ])
+
+    def reset(self):
+        self.hour_deltas, self.attempts.pending = {}, {}
+        self.writer.run(self.storage.transaction, [("DELETE FROM event_hours", ()), ("DELETE FROM attempts", ())])
+        super().reset()
+
+    def hour_counts(self, since_hour: int) -> dict:
+        series = {}
+        rows = self.storage.read("SELECT hour, outcome, count FROM event_hours WHERE hour >= ?", (since_hour,))
+        # الأحداث اللي لسه ماتكتبتش من الـ worker ده
+        for hour, outcome, n in rows + [(h, o, n) for (h, o), n in list(self.hour_deltas.items()) if h >= since_hour]:
+            counts = series.setdefault(hour, {})
+            counts[outcome] = counts.get(outcome, 0) + n
+        return series
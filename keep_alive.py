@@ -1,15 +1,66 @@
-from flask import Flask
-from threading import Thread
+import json
+import asyncio
+import metrics
 
-app = Flask('')
 
-@app.route('/')
-def home():
-    return "Bot is alive"
+class HealthServer:
+    # سيرفر HTTP صغير شغال جوه الـ loop بتاع البوت نفسه: / و /healthz و /readyz و /metrics
+    def __init__(self, host: str = '0.0.0.0', port: int = 8080, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.ready = False
+        self._server = None
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+    async def start(self):
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            print(f"🩺 Health server listening on {self.host}:{self.port}")
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+    async def stop(self):
+        self.ready = False
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def route(self, path: str):
+        if path == '/':
+            return 200, 'text/plain', "Bot is alive"
+        if path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', metrics.render()
+        if path == '/readyz':
+            return (200, 'text/plain', "ready") if self.ready else (503, 'text/plain', "starting")
+        if path == '/healthz':
+            healthy, report = metrics.health()
+            healthy = healthy and self.ready
+            body = json.dumps({"status": "ok" if healthy else "degraded", "ready": self.ready, "checks": report},
+                              ensure_ascii=False, default=str)
+            return 200 if healthy else 503, 'application/json', body
+        return 404, 'text/plain', "not found"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.timeout)
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            parts = request_line.decode('latin-1').split()
+            method = parts[0] if parts else 'GET'
+            path = parts[1].split('?', 1)[0] if len(parts) > 1 else '/'
+            status, content_type, body = self.route(path)
+            payload = body.encode('utf-8')
+            reason = {200: 'OK', 404: 'Not Found', 503: 'Service Unavailable'}[status]
+            head = (
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: {content_type}; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode('latin-1') + (b'' if method == 'HEAD' else payload))
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
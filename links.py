@@ -0,0 +1,154 @@
+from typing import Optional
+
+
+class LinkError(Exception):
+    pass
+
+
+class StudentAlreadyLinked(LinkError):
+    def __init__(self, student_id: str, owner_id: str):
+        super().__init__(f"Student ID {student_id} is already linked to {owner_id}")
+        self.student_id = student_id
+        self.owner_id = owner_id
+
+
+class UserAlreadyLinked(LinkError):
+    def __init__(self, user_id: str, student_id: str):
+        super().__init__(f"Telegram ID {user_id} is already linked to {student_id}")
+        self.user_id = user_id
+        self.student_id = student_id
+
+
+class LinkIndex:
+    # الربط بالاتجاهين: telegram_id -> student_id و student_id -> telegram_id
+    # by_user هو نفس الـ dict اللي بيتحفظ في user_student_map.json
+    def __init__(self, user_student_map: dict):
+        self.by_user = user_student_map
+        self.by_student = {}
+        for uid, sid in user_student_map.items():
+            if sid in self.by_student:
+                print(f"⚠️ Student ID {sid} is linked to more than one user ({self.by_student[sid]}, {uid})")
+                continue
+            self.by_student[sid] = uid
+
+    def __len__(self):
+        return len(self.by_user)
+
+    def __contains__(self, user_id) -> bool:
+        return str(user_id) in self.by_user
+
+    def user_ids(self):
+        return list(self.by_user.keys())
+
+    def items(self) -> list:
+        return list(self.by_user.items())
+
+    def student_of(self, user_id) -> Optional[str]:
+        return self.by_user.get(str(user_id))
+
+    def owner_of(self, student_id) -> Optional[str]:
+        return self.by_student.get(str(student_id))
+
+    def is_taken_by_other(self, user_id, student_id) -> bool:
+        owner = self.owner_of(student_id)
+        return owner is not None and owner != str(user_id)
+
+    def link(self, user_id, student_id) -> bool:
+        # compare-and-set: يا إما الربط يتعمل كله يا إما exception، وبترجع True لو الربط جديد
+        user_id, student_id = str(user_id), str(student_id)
+        owner = self.by_student.get(student_id)
+        if owner is not None and owner != user_id:
+            raise StudentAlreadyLinked(student_id, owner)
+        current = self.by_user.get(user_id)
+        if current is not None and current != student_id:
+            raise UserAlreadyLinked(user_id, current)
+        if current == student_id:
+            return False
+
+        self.by_user[user_id] = student_id
+        self.by_student[student_id] = user_id
+        return True
+
+    def unlink_user(self, user_id) -> Optional[str]:
+        user_id = str(user_id)
+        student_id = self.by_user.pop(user_id, None)
+        if student_id is not None and self.by_student.get(student_id) == user_id:
+            del self.by_student[student_id]
+        return student_id
+
+    def unlink_student(self, student_id) -> Optional[str]:
+        user_id = self.by_student.pop(str(student_id), None)
+        if user_id is not None:
+            self.by_user.pop(user_id, None)
+        return user_id
+
+    def clear(self):
+        self.by_user.clear()
+        self.by_student.clear()
+
+
+class SharedLinkIndex(LinkIndex):
+    # نفس الواجهة بس الداتا في state.db مشتركة بين كل الـ workers؛ الـ UNIQUE على student_id
+    # والـ BEGIN IMMEDIATE بيضمنوا إن مفيش اتنين يربطوا نفس الكود في نفس اللحظة
+    def __init__(self, storage):
+        self.storage = storage
+
+    def _one(self, sql, params) -> Optional[str]:
+        rows = self.storage.read(sql, params)
+        return rows[0][0] if rows else None
+
+    def __len__(self):
+        return self._one("SELECT COUNT(*) FROM links", ())
+
+    def __contains__(self, user_id) -> bool:
+        return self.student_of(user_id) is not None
+
+    def user_ids(self):
+        return [row[0] for row in self.storage.read("SELECT telegram_id FROM links")]
+
+    def items(self) -> list:
+        return [(uid, sid) for uid, sid in self.storage.read("SELECT telegram_id, student_id FROM links")]
+
+    def student_of(self, user_id) -> Optional[str]:
+        return self._one("SELECT student_id FROM links WHERE telegram_id = ?", (str(user_id),))
+
+    def owner_of(self, student_id) -> Optional[str]:
+        return self._one("SELECT telegram_id FROM links WHERE student_id = ?", (str(student_id),))
+
+    def link(self, user_id, student_id) -> bool:
+        user_id, student_id = str(user_id), str(student_id)
+
+        def claim(conn):
+            owner = conn.execute("SELECT telegram_id FROM links WHERE student_id = ?", (student_id,)).fetchone()
+            if owner is not None and owner[0] != user_id:
+                raise StudentAlreadyLinked(student_id, owner[0])
+            current = conn.execute("SELECT student_id FROM links WHERE telegram_id = ?", (user_id,)).fetchone()
+            if current is not None and current[0] != student_id:
+                raise UserAlreadyLinked(user_id, current[0])
+            cursor = conn.execute("INSERT OR IGNORE INTO links (telegram_id, student_id) VALUES (?, ?)", (user_id, student_id))
+            return cursor.rowcount > 0
+
+        return self.storage.atomic(claim)
+
+    def unlink_user(self, user_id) -> Optional[str]:
+        user_id = str(user_id)
+
+        def unlink(conn):
+            row = conn.execute("SELECT student_id FROM links WHERE telegram_id = ?", (user_id,)).fetchone()
+            conn.execute("DELETE FROM links WHERE telegram_id = ?", (user_id,))
+            return row[0] if row else None
+
+        return self.storage.atomic(unlink)
+
+    def unlink_student(self, student_id) -> Optional[str]:
+        student_id = str(student_id)
+
+        def unlink(conn):
+            row = conn.execute("SELECT telegram_id FROM links WHERE student_id = ?", (student_id,)).fetchone()
+            conn.execute("DELETE FROM links WHERE student_id = ?", (student_id,))
+            return row[0] if row else None
+
+        return self.storage.atomic(unlink)
+
+    def clear(self):
+        self.storage.atomic(lambda conn: conn.execute("DELETE FROM links"))
@@ -1,16 +1,32 @@
 import os
-import pandas as pd
-import json
-from pyrogram import Client, filters
+import time
+import asyncio
+import functools
+from pyrogram import Client, filters, idle
+from pyrogram.handlers import MessageHandler
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from typing import Optional
 from datetime import datetime
 from admin_tools import setup_admin_tools
+from result_store import normalize_student_id
+from catalog import ResultCatalog
+from links import LinkIndex, SharedLinkIndex, LinkError, StudentAlreadyLinked, UserAlreadyLinked
+from storage import open_storage, save_json, UsageBuffer, SharedAdminList
+from permissions import Permissions, AdminSet, OWNER
+from broadcast import BroadcastEngine
+from stats import UsageStats, SharedUsageStats
+from ratelimit import SlidingWindowLimiter, SharedRateLimiter
+from events import UsageEventLog, SharedUsageEventLog, SUCCESS, CONFLICT, NOT_FOUND, RATE_LIMITED
+from profiles import ProfileCache
+from background import StateWriter, LoopLagMonitor, run_blocking
+from workers import run_workers
+from keep_alive import HealthServer
+from startup import StartupTimer
+import metrics
 from dotenv import load_dotenv
 
 load_dotenv()
-from keep_alive import keep_alive
-keep_alive()
+WORKER_ID = os.getenv("WORKER_ID")
 # Bot credentials
 API_ID = int(os.getenv("API_ID"))
 API_HASH = os.getenv("API_HASH")
@@ -19,35 +35,222 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 # File paths
 EXCEL_FILE = 'result.xlsx'
 SHEET_NAME = 'Sheet1'
+RESULT_SETS_FILE = 'result_sets.json'
+MAX_RESIDENT_RESULT_SETS = int(os.getenv("MAX_RESIDENT_RESULT_SETS", "2"))
 USER_STUDENT_MAP_FILE = 'user_student_map.json'
 ADMIN_LIST_FILE = 'admin_list.json'
 STUDENT_USAGE_FILE = 'student_usage.json'
+# كل worker ليه سجل أحداث خاص بيه
+EVENT_LOG_PREFIX = 'usage_events' if WORKER_ID is None else f'usage_events.w{WORKER_ID}'
+SNAPSHOT_DIR = '.cache'
+RELOAD_INTERVAL = float(os.getenv("RELOAD_INTERVAL", "5"))
+STATE_DB_FILE = 'state.db'
+STATE_BACKEND = os.getenv("STATE_BACKEND", "json")  # json | sqlite | shared
+WORKERS = int(os.getenv("WORKERS", "1"))  # أكتر من 1 = كذا بروسس على state.db واحدة
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "10"))
+USAGE_FLUSH_EVERY = int(os.getenv("USAGE_FLUSH_EVERY", "200"))
+BROADCAST_STATE_FILE = 'broadcast_state.json'
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # رسالة في الثانية (حد تيليجرام حوالي 30)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+RATE_LIMIT_COUNT = int(os.getenv("RATE_LIMIT_COUNT", "5"))  # عدد الطلبات المسموح بيها لكل مستخدم
+RATE_LIMIT_WINDOW = float(os.getenv("RATE_LIMIT_WINDOW", "60"))  # في خلال كام ثانية
 INITIAL_ADMIN_ID = 933493534
-
-# Helper functions
-def load_json(filename, default):
-    if os.path.exists(filename):
-        with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return default
-
-def save_json(filename, data):
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+# أصحاب البوت: دايماً إدمن، ومحدش يقدر يشيلهم، وهما بس اللي يقدروا يشيلوا إدمن
+OWNER_IDS = [INITIAL_ADMIN_ID] + [int(uid) for uid in os.getenv("OWNER_IDS", "").split(",") if uid.strip().isdigit()]
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", "8080"))
+PERSISTENCE_STALE_AFTER = float(os.getenv("PERSISTENCE_STALE_AFTER", "60"))  # ثواني قبل ما /healthz يقول إن الحفظ واقف
+# أوامر بيرد عليها worker 0 بس: الإذاعة حالتها في broadcast_state.json وهو بس اللي بيكملها بعد الريستارت
+WORKER_ZERO_COMMANDS = {"broadcast"}
+WORKER_ZERO_GRACE = float(os.getenv("WORKER_ZERO_GRACE", "10"))  # ثواني قبل ما worker تاني يرد إن worker 0 مش بيرد
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", "15"))  # ثواني من بداية البروسس لحد أول update
+
+RESULT_REQUESTS = metrics.Counter("bot_result_requests_total", "Result requests by outcome")
+HANDLE_RESULT_SECONDS = metrics.Histogram("bot_handle_result_seconds", "End-to-end time of handle_result")
+LOOKUP_SECONDS = metrics.Histogram("bot_result_lookup_seconds", "Time spent in get_student_result")
+LINK_SECONDS = metrics.Histogram("bot_link_seconds", "Time spent linking an account, including the state.db transaction in shared mode")
+LINKED_USERS = metrics.Gauge("bot_linked_users", "Telegram accounts linked to a student ID")
+RESIDENT_RESULT_SETS = metrics.Gauge("bot_resident_result_sets", "Result workbooks currently loaded in memory")
+STATE_WRITE_BACKLOG = metrics.Gauge("bot_state_write_backlog", "State writes queued on the writer thread")
+STATE_STALENESS = metrics.Gauge("bot_state_staleness_seconds", "Age of the oldest state write still waiting to be persisted")
+USAGE_PENDING = metrics.Gauge("bot_usage_pending_events", "Usage increments buffered in memory")
+BROADCAST_QUEUE = metrics.Gauge("bot_broadcast_queue_depth", "Users still waiting for the running broadcast")
+LOOP_LAG = metrics.Gauge("bot_event_loop_lag_seconds", "Last measured event loop lag")
+
+LINK_CONFLICT_TEXT = (
+    "❌ **تم استخدام كود الطالب الخاص بك من قِبل شخص آخر.**\n"
+    "📞 تواصل مع:\n @youssra_fayed \n @Zahra_3laa \n @El_karadawy \n @Dr_M_ElBaz \n @ElHaWary_M \n @Karimaboraya \n"
+    "🛠️دعم التقنية : @M7MED1573 "
+)
+
+def format_percentage(value) -> str:
+    # الخلية ممكن تكون فاضية (None أو NaN من pandas) أو نص؛ الأرقام بس هي اللي بتتنسق
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return "—" if value is None or value == "" else str(value)
+    if number != number:
+        return "—"
+    return f"{number:.2f}%"
 
 class StudentResultBot:
     def __init__(self):
-        self.app = Client("student_result_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
-        self.user_student_map = load_json(USER_STUDENT_MAP_FILE, {})
-        self.admin_list = load_json(ADMIN_LIST_FILE, [INITIAL_ADMIN_ID])
-        self.student_usage = load_json(STUDENT_USAGE_FILE, {})
+        self.startup = StartupTimer(STARTUP_BUDGET)
+        self.startup.mark("imports")
+        session = "student_result_bot" if WORKER_ID is None else f"student_result_bot_{WORKER_ID}"
+        self.app = Client(session, api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+        self.writer = StateWriter(save_json)
+        self.storage = open_storage(STATE_BACKEND, self.writer, STATE_DB_FILE, USER_STUDENT_MAP_FILE, ADMIN_LIST_FILE, STUDENT_USAGE_FILE)
+        if self.storage.shared:
+            self.links = SharedLinkIndex(self.storage)
+            admins = SharedAdminList(self.storage, [INITIAL_ADMIN_ID])
+        else:
+            self.user_student_map = self.storage.load_links()
+            self.links = LinkIndex(self.user_student_map)
+            admins = AdminSet(self.storage.load_admins([INITIAL_ADMIN_ID]))
+        self.permissions = Permissions(admins, OWNER_IDS, save=self.storage.save_admins)
+        self.student_usage = self.storage.load_usage()
+        event_log_args = (self.writer, EVENT_LOG_PREFIX, self.student_usage)
+        event_log_kwargs = dict(journal_usage=not self.storage.persists_usage,
+                                flush_interval=USAGE_FLUSH_INTERVAL, flush_every=USAGE_FLUSH_EVERY)
+        if self.storage.shared:
+            self.events = SharedUsageEventLog(self.storage, *event_log_args, **event_log_kwargs)
+        else:
+            self.events = UsageEventLog(*event_log_args, **event_log_kwargs)
+        replayed = self.events.load()
+        if replayed:
+            print(f"🧾 Replayed {replayed} usage events since the last compaction")
+        self.attempts = self.events.attempts
+        self.startup.mark("state")
+        if self.storage.shared:
+            # الإحصائيات والـ rate limit لازم يبقوا على كل الـ workers مع بعض، مش لكل بروسس لوحده
+            self.stats = SharedUsageStats(self.storage, self.attempts)
+            self.limiter = SharedRateLimiter(self.storage, RATE_LIMIT_COUNT, RATE_LIMIT_WINDOW)
+        else:
+            self.stats = UsageStats(self.student_usage, self.links, self.attempts)
+            self.limiter = SlidingWindowLimiter(RATE_LIMIT_COUNT, RATE_LIMIT_WINDOW)
+        self.profiles = ProfileCache(self.app)
+        self.usage_buffer = UsageBuffer(self.storage, self.student_usage, USAGE_FLUSH_INTERVAL, USAGE_FLUSH_EVERY)
+        self.loop_lag = LoopLagMonitor()
+        # في وضع الـ workers أول worker بس هو اللي بيفتح البورت
+        self.health_server = HealthServer(port=HEALTH_PORT) if WORKER_ID in (None, "0") else None
+        self.broadcaster = BroadcastEngine(self.app, self.writer, BROADCAST_STATE_FILE, BROADCAST_RATE, BROADCAST_CONCURRENCY)
+        self.catalog = ResultCatalog(
+            RESULT_SETS_FILE, SNAPSHOT_DIR, max_resident=MAX_RESIDENT_RESULT_SETS,
+            fallback={"key": "default", "file": EXCEL_FILE, "sheet": SHEET_NAME},
+        )
+        self.catalog.start_watcher(RELOAD_INTERVAL)
+        self.register_metrics()
+        if self.storage.shared:
+            self.app.add_handler(MessageHandler(self.claim_update), group=-2)
+        # group -1 بيتنادى قبل أي هاندلر تاني، وبيشيل نفسه بعد أول رسالة
+        self.first_update_handler = MessageHandler(self.on_first_update)
+        self.app.add_handler(self.first_update_handler, group=-1)
         self.setup_handlers()
         setup_admin_tools(self)
-
-    def save_state(self):
-        save_json(USER_STUDENT_MAP_FILE, self.user_student_map)
-        save_json(ADMIN_LIST_FILE, self.admin_list)
-        save_json(STUDENT_USAGE_FILE, self.student_usage)
+        self.permissions.install(self.app)
+        self.startup.mark("handlers")
+
+    def register_metrics(self):
+        LINKED_USERS.func = lambda: len(self.links)
+        RESIDENT_RESULT_SETS.func = lambda: sum(1 for s in self.catalog.sets.values() if s.resident)
+        STATE_WRITE_BACKLOG.func = lambda: self.writer.backlog
+        STATE_STALENESS.func = self.writer.staleness
+        USAGE_PENDING.func = lambda: self.usage_buffer.pending_events
+        BROADCAST_QUEUE.func = lambda: len(self.broadcaster.remaining()) if self.broadcaster.running else 0
+        LOOP_LAG.func = lambda: self.loop_lag.last_lag
+        metrics.register_health("results", self.results_health)
+        metrics.register_health("persistence", self.persistence_health)
+        metrics.register_health("startup", self.startup.health)
+
+    def results_health(self):
+        result_set = self.catalog.default
+        snapshot = result_set.store.snapshot
+        if snapshot is None:
+            return False, {"set": result_set.key, "loaded": False}
+        return True, {"set": result_set.key, "loaded": True, "rows": len(snapshot.records), "source": snapshot.source}
+
+    def persistence_health(self):
+        staleness = self.writer.staleness()
+        last_write = self.writer.last_write_time
+        return staleness < PERSISTENCE_STALE_AFTER, {
+            "backend": STATE_BACKEND,
+            "pending_writes": self.writer.backlog,
+            "staleness_seconds": round(staleness, 3),
+            "last_write_age_seconds": round(time.time() - last_write, 3) if last_write else None,
+            "buffered_usage_events": self.usage_buffer.pending_events,
+        }
+
+    async def run_state(self, func, *args):
+        # في وضع الـ workers كل عملية على state.db (وخصوصاً التعديلات اللي ممكن تستنى قفل worker تاني
+        # لحد 10 ثواني) بتتنفذ برا الـ loop. في الوضع العادي الحالة في الميموري فبتفضل على الـ loop
+        if self.storage.shared:
+            return await run_blocking(func, *args)
+        return func(*args)
+
+    @LINK_SECONDS.timed
+    def link_student(self, user_id, student_id):
+        if self.links.link(user_id, student_id):
+            self.storage.save_link(user_id, student_id)
+
+    def unlink_user(self, user_id):
+        student_id = self.links.unlink_user(user_id)
+        if student_id is not None:
+            self.storage.delete_link(user_id)
+        return student_id
+
+    def unlink_student(self, student_id):
+        user_id = self.links.unlink_student(student_id)
+        if user_id is not None:
+            self.storage.delete_link(user_id)
+        return user_id
+
+    def import_links(self, pairs, replace: bool = False):
+        # دفعة من /import: بترجع (اتربط، متعارض واتساب، كان مربوط كده أصلاً)
+        linked, conflicts, unchanged = [], 0, 0
+        for user_id, student_id in pairs:
+            try:
+                if self.links.link(user_id, student_id):
+                    linked.append((user_id, student_id))
+                else:
+                    unchanged += 1
+            except LinkError:
+                if not replace:
+                    conflicts += 1
+                    continue
+                self.unlink_student(student_id)
+                self.unlink_user(user_id)
+                self.links.link(user_id, student_id)
+                linked.append((user_id, student_id))
+        self.storage.save_links(linked)
+        return len(linked), conflicts, unchanged
+
+    async def reset_state(self):
+        await self.run_state(self.links.clear)
+        self.events.reset()
+        self.usage_buffer.discard()
+        self.stats.rebuild(self.student_usage, self.links, self.attempts)
+        self.storage.clear_links()
+        self.storage.clear_usage()
+
+    async def get_results_snapshot(self, result_set=None):
+        result_set = result_set or self.catalog.default
+        # الـ watcher أو هاندلر تاني ممكن يشيل الشيت في أي لحظة، فبناخد الـ snapshot نفسه مرة واحدة
+        # ولو مش موجود التحميل بيحصل في thread، عمره ما بيحصل على الـ loop
+        snapshot = self.catalog.peek(result_set)
+        if snapshot is not None:
+            return snapshot
+        return await run_blocking(self.catalog.snapshot, result_set)
+
+    async def find_result_set(self, student_id: str, key: str = None):
+        student_id = normalize_student_id(student_id)
+        result_sets = [self.catalog.get(key)] if key else self.catalog.candidates(student_id)
+        for result_set in result_sets:
+            if result_set is None:
+                continue
+            snapshot = await self.get_results_snapshot(result_set)
+            if student_id in snapshot.records:
+                return result_set, snapshot
+        return None, None
 
     def setup_handlers(self):
         @self.app.on_message(filters.command("start"))
@@ -62,15 +265,15 @@ class StudentResultBot:
         async def result_command(client: Client, message: Message):
             await self.handle_result(message)
 
-        @self.app.on_message(filters.command("admin"))
+        @self.app.on_message(self.permissions.command("admin"))
         async def add_admin_command(client: Client, message: Message):
             await self.handle_add_admin(message)
 
-        @self.app.on_message(filters.command("who"))
+        @self.app.on_message(self.permissions.command("who"))
         async def whois_command(client: Client, message: Message):
             await self.handle_whois(message)
 
-        @self.app.on_message(filters.command("remove"))
+        @self.app.on_message(self.permissions.command("remove", OWNER))
         async def remove_admin_command(client: Client, message: Message):
             await self.handle_remove_admin(message)
 
@@ -89,53 +292,46 @@ class StudentResultBot:
        )
     async def get_student_info_by_id(self, student_id: str) -> dict:
         try:
-            df = pd.read_excel(EXCEL_FILE, sheet_name=SHEET_NAME)
-            df.columns = df.columns.str.strip()  # clean up column headers
-            df.rename(columns={'ID': 'id', 'اسم الطالب': 'Name'}, inplace=True)
-            df['id'] = df['id'].astype(str).str.strip().str.replace('.0', '', regex=False)
-            student_row = df[df['id'] == str(student_id)]
-            if not student_row.empty:
+            _, snapshot = await self.find_result_set(student_id)
+            name = snapshot.names.get(normalize_student_id(student_id)) if snapshot else None
+            if name is not None:
                 return {
-                    "name": student_row['Name'].iloc[0]
+                    "name": name
                 }
         except Exception as e:
             print(f"Error loading student info: {e}")
         return {}
     async def handle_admin_list(self, message: Message):
-        if not self.admin_list:
+        admin_ids = self.permissions.admin_ids()
+        if not admin_ids:
             await message.reply_text("🚫 مفيش إدمنات مسجلين حالياً.")
             return
 
         text = "👮‍♂️ قائمة الإدمنات الحاليين:\n\n"
-        for admin_id in self.admin_list:
-            try:
-                user = await self.app.get_users(admin_id)
+        users = await self.profiles.get_many(admin_ids)
+        for admin_id in admin_ids:
+            user = users.get(int(admin_id))
+            if user is not None:
                 name = f"{user.first_name or ''} {user.last_name or ''}".strip()
                 username = f"@{user.username}" if user.username else "بدون يوزر"
                 text += f"• {name} ({username}) - ID: `{admin_id}`\n"
-            except:
+            else:
                 text += f"• ID: `{admin_id}` (ماقدرناش نجيب معلوماته)\n"
 
         await message.reply_text(text)
 
     async def handle_add_admin(self, message: Message):
-        user_id = message.from_user.id
-        if user_id not in self.admin_list:
-            await message.reply_text("❌ Only admins can add new admins.")
-            return
-
         command_parts = message.text.split()
         if len(command_parts) != 2 or not command_parts[1].isdigit():
             await message.reply_text("Usage: /addadmin <telegram_user_id>")
             return
 
         new_admin_id = int(command_parts[1])
-        if new_admin_id in self.admin_list:
+        if self.permissions.is_admin(new_admin_id):
             await message.reply_text("ℹ️ This user is already an admin.")
             return
 
-        self.admin_list.append(new_admin_id)
-        self.save_state()
+        await self.run_state(self.permissions.grant, new_admin_id)
         await message.reply_text(f"✅ User `{new_admin_id}` has been added as an admin.")
 
         try:
@@ -156,10 +352,6 @@ class StudentResultBot:
 
     async def handle_remove_admin(self, message: Message):
         user_id = message.from_user.id
-        if user_id not in self.admin_list:
-            await message.reply_text("❌ Only admins can remove other admins.")
-            return
-
         parts = message.text.strip().split()
         if len(parts) != 2 or not parts[1].isdigit():
             await message.reply_text("Usage: /remove <telegram_user_id>")
@@ -170,12 +362,14 @@ class StudentResultBot:
             await message.reply_text("⚠️ You cannot remove yourself.")
             return
 
-        if target_id not in self.admin_list:
+        if self.permissions.is_owner(target_id):
+            await message.reply_text("⚠️ You cannot remove an owner.")
+            return
+
+        if not await self.run_state(self.permissions.revoke, target_id):
             await message.reply_text("❌ This user is not an admin.")
             return
 
-        self.admin_list.remove(target_id)
-        self.save_state()
         await message.reply_text(f"✅ User {target_id} has been removed from admin list.")
 
         try:
@@ -186,70 +380,92 @@ class StudentResultBot:
             )
         except: pass
 
+    @HANDLE_RESULT_SECONDS.timed
     async def handle_result(self, message: Message):
         user_id = message.from_user.id
+        is_admin = self.permissions.is_admin(user_id)
+        if not is_admin and not await self.run_state(self.limiter.allow, user_id):
+            RESULT_REQUESTS.inc(outcome="rate_limited")
+            self.events.record(RATE_LIMITED, user_id, self.extract_student_id(message))
+            if self.limiter.warn_once(user_id):
+                wait = int(self.limiter.retry_after(user_id)) + 1
+                await message.reply_text(f"⏳ طلبات كتير ورا بعض، حاول تاني بعد {wait} ثانية.")
+            return
+
         student_id = self.extract_student_id(message)
+        result_key = self.extract_result_set(message)
         if not student_id:
+            RESULT_REQUESTS.inc(outcome="invalid")
             await message.reply_text("❌ please send me /result رقم الجلوس .\n or just send رقم الجلوس directly.")
             return
 
-        if user_id in self.admin_list:
-            result = await self.get_student_result(student_id)
+        if is_admin:
+            result = await self.get_student_result(student_id, result_key)
             if result:
-                self.track_usage(student_id)
+                self.track_usage(user_id, student_id)
+            else:
+                self.events.record(NOT_FOUND, user_id, student_id)
+            RESULT_REQUESTS.inc(outcome="success" if result else "not_found")
             await message.reply_text(result or f"❌ No results found for ID: {student_id}")
             return
 
-        registered_id = self.user_student_map.get(str(user_id))
-        for uid, sid in self.user_student_map.items():
-            if sid == student_id and uid != str(user_id):
-                await message.reply_text(
-                    "❌ **تم استخدام كود الطالب الخاص بك من قِبل شخص آخر.**\n"
-                    "📞 تواصل مع:\n @youssra_fayed \n @Zahra_3laa \n @El_karadawy \n @Dr_M_ElBaz \n @ElHaWary_M \n @Karimaboraya \n"
-                    "🛠️دعم التقنية : @M7MED1573 "
-                )
-                return
-
-        result = await self.get_student_result(student_id)
+        if self.links.is_taken_by_other(user_id, student_id):
+            self.record_denied(user_id, student_id)
+            RESULT_REQUESTS.inc(outcome="conflict")
+            await message.reply_text(LINK_CONFLICT_TEXT)
+            return
+
+        result = await self.get_student_result(student_id, result_key)
         if not result:
+            RESULT_REQUESTS.inc(outcome="not_found")
+            self.events.record(NOT_FOUND, user_id, student_id)
             await message.reply_text("❌ عذرًا، نتيجتك مش متاحة دلوقتي.")
             return
 
-        if registered_id is None:
-            self.user_student_map[str(user_id)] = student_id
-        elif registered_id != student_id:
+        # الربط بيحصل بعد ما النتيجة جت كـ compare-and-set: link بتتأكد وتكتب في خطوة واحدة
+        # (في الميموري من غير await، أو transaction في state.db)، فلو حد تاني سبق وربط الكود الطلب ده بيترفض
+        try:
+            await self.run_state(self.link_student, user_id, student_id)
+        except StudentAlreadyLinked:
+            self.record_denied(user_id, student_id)
+            RESULT_REQUESTS.inc(outcome="conflict")
+            await message.reply_text(LINK_CONFLICT_TEXT)
+            return
+        except UserAlreadyLinked:
+            self.record_denied(user_id, student_id)
+            RESULT_REQUESTS.inc(outcome="denied")
             await message.reply_text("❌ You can only access your linked result.")
             return
 
-        self.track_usage(student_id)
-        self.save_state()
+        self.track_usage(user_id, student_id)
+        RESULT_REQUESTS.inc(outcome="success")
         await message.reply_text(result + "\n\n🔒 ID linked to your account.")
 
     async def handle_whois(self, message: Message):
-        user_id = message.from_user.id
-        if user_id not in self.admin_list:
-            await message.reply_text("❌ الأمر ده للمشرفين بس.")
-            return
-
         parts = message.text.split()
         if len(parts) != 2 or not parts[1].isdigit():
             await message.reply_text("الاستخدام الصحيح:\n/who <student_id> ")
             return
 
         target_id = parts[1]
-        for uid, sid in self.user_student_map.items():
-            if sid == target_id:
-                try:
-                    user = await self.app.get_users(int(uid))
-                    student_info = await self.get_student_info_by_id(target_id)
-                    student_name = student_info.get("name", "—")
-                    usage = self.student_usage.get(target_id, {})
-                    access_count = usage.get("count", 0)
-                    last_time = usage.get("last_time")
-                    if last_time:
-                        last_time = datetime.fromisoformat(last_time).strftime("%Y-%m-%d %H:%M")
-
-                    info = f"""
+        uid = await self.run_state(self.links.owner_of, target_id)
+        if uid is None:
+            await message.reply_text("❌ مفيش حد مربوط بالـ Student ID ده.")
+            return
+
+        try:
+            user = await self.profiles.get(uid)
+            if user is None:
+                raise ValueError(f"ماقدرناش نجيب بيانات المستخدم {uid}")
+            student_info = await self.get_student_info_by_id(target_id)
+            student_name = student_info.get("name", "—")
+            usage = await self.run_state(self.usage_of, target_id)
+            access_count = usage.get("count", 0)
+            last_time = usage.get("last_time")
+            if last_time:
+                last_time = datetime.fromisoformat(last_time).strftime("%Y-%m-%d %H:%M")
+
+            info = f"""
 📌 **بيانات الطالب:**
 
 🆔 **Student ID:** `{target_id}`
@@ -267,13 +483,10 @@ class StudentResultBot:
 🕒 **آخر مرة ظهر فيها:** {last_time or 'غير متوفر'}
 """
 
-                    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("💬 كلمه على الخاص", url=f"https://t.me/{user.username}")]]) if user.username else None
-                    await message.reply_text(info, reply_markup=keyboard)
-                    return
-                except Exception as e:
-                    await message.reply_text(f"❌ حصل خطأ: {e}")
-                    return
-        await message.reply_text("❌ مفيش حد مربوط بالـ Student ID ده.")
+            keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("💬 كلمه على الخاص", url=f"https://t.me/{user.username}")]]) if user.username else None
+            await message.reply_text(info, reply_markup=keyboard)
+        except Exception as e:
+            await message.reply_text(f"❌ حصل خطأ: {e}")
 
     def extract_student_id(self, message: Message) -> Optional[str]:
         parts = message.text.split()
@@ -281,64 +494,164 @@ class StudentResultBot:
             return parts[0]
         if len(parts) == 2 and parts[1].isdigit():
             return parts[1]
+        # /result <الترم> <رقم الجلوس>
+        if len(parts) == 3 and parts[1] in self.catalog.sets and parts[2].isdigit():
+            return parts[2]
         return None
 
-    async def get_student_result(self, student_id: str) -> Optional[str]:
-        try:
-            if not os.path.exists(EXCEL_FILE):
-                raise FileNotFoundError(f"Excel file '{EXCEL_FILE}' not found")
-
-            df = pd.read_excel(EXCEL_FILE, sheet_name=SHEET_NAME)
-            df.rename(columns={'ID': 'id', 'اسم الطالب': 'Name'}, inplace=True)
-            df['id'] = df['id'].astype(str).str.strip().str.replace('.0', '', regex=False)
-            student_id = str(student_id).strip()
+    def extract_result_set(self, message: Message) -> Optional[str]:
+        parts = message.text.split()
+        if len(parts) == 3 and parts[1] in self.catalog.sets:
+            return parts[1]
+        return None
 
-            row = df[df['id'] == student_id]
-            if row.empty:
+    @LOOKUP_SECONDS.timed
+    async def get_student_result(self, student_id: str, key: str = None) -> Optional[str]:
+        try:
+            result_set, snapshot = await self.find_result_set(student_id, key)
+            if snapshot is None:
                 return None
+            return snapshot.render(student_id, functools.partial(self.render_result, result_set))
+        except Exception as e:
+            # None زي "مش موجود" علشان handle_result مايربطش الكود بنتيجة مش سليمة
+            print(f"Error rendering result for {student_id}: {e}")
+            return None
+
+    async def get_student_results(self, student_ids: list, key: str = None) -> dict:
+        # دفعة أكواد: كل شيت بيتجاب مرة واحدة وكل الأكواد اللي لسه مالقيناهاش بتدور فيه
+        results = {}
+        missing = [normalize_student_id(sid) for sid in student_ids]
+        result_sets = [self.catalog.get(key)] if key else self.catalog.ordered()
+        for result_set in result_sets:
+            if result_set is None or not missing:
+                continue
+            if not key and not any(result_set.may_contain(sid) for sid in missing):
+                continue
+            snapshot = await self.get_results_snapshot(result_set)
+            renderer = functools.partial(self.render_result, result_set)
+            still_missing = []
+            for sid in missing:
+                if sid in snapshot.records:
+                    try:
+                        results[sid] = snapshot.render(sid, renderer)
+                    except Exception as e:
+                        print(f"Error rendering result for {sid}: {e}")
+                else:
+                    still_missing.append(sid)
+            missing = still_missing
+        return results
+
+    def render_result(self, result_set, student_id: str, row: dict) -> str:
+        # المواد والأعمدة جاية من result_sets.json لكل ترم
+        name = row['Name']
+        grades = ""
+        for label, column in result_set.subjects.items():
+            grades += f"🔹 {label} : {row.get(column)}\n"
+        if result_set.total_column:
+            grades += f"🔹 **Total** : {row.get(result_set.total_column)}\n"
+        if result_set.percentage_column:
+            grades += f"🔹 **Percentage** : {format_percentage(row.get(result_set.percentage_column))}\n"
+        if grades:
+            grades = f"""
+📚 **Subject Grades:**
+━━━━━━━━━━━━━━━━━━━━━━━
+{grades}"""
 
-            name = row['Name'].iloc[0]
-            Dermatology = row['Dermatology'].iloc[0]
-            ENT = row['ENT'].iloc[0]
-            Family_medicine = row['Family medicine'].iloc[0]
-            Radiology = row['Radiology'].iloc[0]
-            total = row['Total'].iloc[0]
-            percentage = row['percentage'].iloc[0]
-
-            return f"""
+        return f"""
 🎓 **Student Result**
 ━━━━━━━━━━━━━━━━━━━━━━━
 👤 **Full Name**     : {name}  
 🆔 **Student ID**    : `{student_id}`
-🗓️ **Semester**      :   **9**  
-
-📚 **Subject Grades:**
-━━━━━━━━━━━━━━━━━━━━━━━
-🔹 Dermatology : {Dermatology}
-🔹 ENT : {ENT}
-🔹 Family Medicine : {Family_medicine}
-🔹 Radiology : {Radiology}
-🔹 **Total** : {total}
-🔹 **Percentage** : {percentage:.2f}%
-━━━━━━━━━━━━━━━━━━━━━━━
+🗓️ **Semester**      :   **{result_set.semester}**  
+{grades}━━━━━━━━━━━━━━━━━━━━━━━
 🔒 **Privacy Notice:** Your Student ID has been securely linked to your Telegram account to protect your academic data.
 
 """
-        except Exception as e:
-            return f"Error: {str(e)}"
 
 
 
-    def track_usage(self, student_id: str):
-        usage = self.student_usage.get(student_id, {"count": 0})
-        usage["count"] += 1
-        usage["last_time"] = datetime.now().isoformat()
-        self.student_usage[student_id] = usage
+    def record_denied(self, user_id, student_id: str):
+        self.events.record(CONFLICT, user_id, student_id)
+        self.stats.record_denied(user_id, student_id)
+
+    def usage_of(self, student_id: str) -> dict:
+        # في وضع الـ workers العداد الحقيقي في state.db مش في ميموري البروسس ده
+        if self.storage.shared:
+            return self.storage.usage_of(student_id)
+        return self.student_usage.get(student_id, {})
+
+    def track_usage(self, user_id, student_id: str):
+        # السجل هو اللي بيزود student_usage؛ usage_buffer بيكتب الزيادة في SQLite لو شغالين عليها
+        usage = self.events.record(SUCCESS, user_id, student_id)
+        self.usage_buffer.record(student_id)
+        self.stats.record_lookup(student_id, usage["count"])
+
+    async def claim_update(self, client, message):
+        # كل الـ workers بيستلموا نفس الرسالة؛ اللي مالحقش يسجلها في state.db بيسيبها من غير رد
+        text = message.text or ""
+        command = text.split(maxsplit=1)[0][1:].split('@')[0].lower() if text.startswith('/') else None
+        if command in WORKER_ZERO_COMMANDS and WORKER_ID not in (None, "0"):
+            # مانسكتش عليها: لو worker 0 مالحقهاش في المهلة، اللي يسجلها مننا يقول للإدمن يعيد
+            asyncio.get_running_loop().create_task(self.defer_to_worker_zero(message))
+            message.stop_propagation()
+        if not await run_blocking(self.storage.claim_update, message.chat.id, message.id):
+            message.stop_propagation()
+
+    async def defer_to_worker_zero(self, message: Message):
+        await asyncio.sleep(WORKER_ZERO_GRACE)
+        if await run_blocking(self.storage.claim_update, message.chat.id, message.id):
+            await message.reply_text("⚠️ الأمر ده بيشغله worker 0 بس، وهو مش بيرد دلوقتي. جرب تاني كمان شوية.")
+
+    async def on_first_update(self, client, message):
+        self.startup.update_received()
+        client.remove_handler(self.first_update_handler, group=-1)
+
+    async def preload_results(self):
+        # الشيت بيتحمل بعد ما البوت يتصل، فالبوت بيبدأ يستقبل من غير ما يستنى الإكسيل،
+        # وأي طلب نتيجة بيوصل قبل ما يخلص بيستنى نفس التحميل في thread
+        try:
+            snapshot = await run_blocking(self.catalog.snapshot, self.catalog.default)
+            self.startup.mark("results")
+            print(f"📄 Loaded {len(snapshot.records)} results from {snapshot.source} in {snapshot.parse_time * 1000:.0f}ms")
+        except Exception as e:
+            print(f"Error loading results: {e}")
+
+    async def main(self):
+        async with self.app:
+            self.startup.mark("connected")
+            preload = asyncio.get_running_loop().create_task(self.preload_results())
+            # السيرفر بيقوم بعد ما الكلاينت يتصل، و/readyz بيرد 200 بس لما كل حاجة تشتغل
+            if self.health_server is not None:
+                await self.health_server.start()
+            self.loop_lag.start()
+            self.usage_buffer.start()
+            self.events.start()
+            if WORKER_ID in (None, "0"):
+                await self.broadcaster.resume()
+            if self.health_server is not None:
+                self.health_server.ready = True
+            print(f"🚀 Bot is running... (ready in {self.startup.mark('ready'):.2f}s)")
+            # idle() بيرجع مع SIGTERM/SIGINT، فالعدادات اللي في الميموري بتتحفظ قبل الخروج
+            await idle()
+            preload.cancel()
+            if self.health_server is not None:
+                await self.health_server.stop()
+            self.loop_lag.stop()
+            self.usage_buffer.stop()
+            self.events.stop()
+            self.broadcaster.stop()
+        self.writer.close()
+        self.storage.close()
 
     def run(self):
-        print("🚀 Bot is running...")
-        self.app.run()
+        self.app.run(self.main())
+
+def prepare_shared_state():
+    # الاستيراد من ملفات JSON بيحصل مرة واحدة قبل ما الـ workers يقوموا
+    open_storage("shared", None, STATE_DB_FILE, USER_STUDENT_MAP_FILE, ADMIN_LIST_FILE, STUDENT_USAGE_FILE).close()
 
 if __name__ == "__main__":
+    if WORKERS > 1 and WORKER_ID is None:
+        raise SystemExit(run_workers(WORKERS, os.path.abspath(__file__), prepare_shared_state))
     bot = StudentResultBot()
     bot.run()
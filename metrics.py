@@ -0,0 +1,148 @@
+import time
+import bisect
+import inspect
+import functools
+import threading
+
+# عدادات وهيستوجرامات بسيطة بصيغة Prometheus من غير أي مكتبة زيادة
+REGISTRY = []
+HEALTH_CHECKS = {}
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels_text(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in list(self.values.items()):
+            lines.append(f"{self.name}{_labels_text(key)} {value}")
+        return lines
+
+
+class Gauge:
+    # القيمة يا إما بتتحط بـ set يا إما بتتحسب وقت القراءة من func
+    def __init__(self, name: str, help_text: str, func=None):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+        self.current = 0.0
+        REGISTRY.append(self)
+
+    def set(self, value: float):
+        self.current = value
+
+    def value(self) -> float:
+        return self.func() if self.func is not None else self.current
+
+    def render(self) -> list:
+        try:
+            value = self.value()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def timed(self, func):
+        # decorator للدوال العادية والـ async
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self.time():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.time():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{self.name}_sum {self.sum}")
+            lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def register_health(name: str, check):
+    # check() بترجع (سليم ولا لأ, تفاصيل)
+    HEALTH_CHECKS[name] = check
+
+
+def health():
+    healthy = True
+    report = {}
+    for name, check in HEALTH_CHECKS.items():
+        try:
+            ok, details = check()
+        except Exception as e:
+            ok, details = False, {"error": str(e)}
+        healthy = healthy and ok
+        report[name] = dict(details, ok=ok)
+    return healthy, report
@@ -0,0 +1,93 @@
+from pyrogram import filters
+
+OWNER = "owner"
+ADMIN = "admin"
+
+DENIED_TEXT = {
+    ADMIN: "❌ الأمر ده مخصص للإدمن فقط.",
+    OWNER: "❌ الأمر ده لصاحب البوت بس.",
+}
+
+
+class AdminSet:
+    # set بترتيب الإضافة (علشان /adminlist وملف admin_list.json يفضلوا بنفس الترتيب)
+    def __init__(self, user_ids):
+        self._ids = dict.fromkeys(int(uid) for uid in user_ids)
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._ids
+
+    def __iter__(self):
+        return iter(list(self._ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, user_id):
+        self._ids[int(user_id)] = None
+
+    def discard(self, user_id):
+        self._ids.pop(int(user_id), None)
+
+
+async def check_role(flt, client, message) -> bool:
+    # async علشان pyrogram مايشغلش الـ filter في thread pool لما يتجمع مع filters تانية
+    user = message.from_user
+    if user is None:
+        return False
+    if flt.role == OWNER:
+        return flt.permissions.is_owner(user.id)
+    return flt.permissions.is_admin(user.id)
+
+
+class Permissions:
+    # مكان واحد للصلاحيات: أي تعديل في الأدوار بيبان فوراً في كل الهاندلرز لأنهم كلهم بيسألوا هنا
+    def __init__(self, admins, owners, save=None):
+        self.admins = admins  # AdminSet أو SharedAdminList في وضع الـ workers
+        self.owners = {int(uid) for uid in owners}
+        self.save = save
+        self.guarded = {ADMIN: set(), OWNER: set()}
+        self.filters = {
+            ADMIN: filters.create(check_role, "AdminFilter", permissions=self, role=ADMIN),
+            OWNER: filters.create(check_role, "OwnerFilter", permissions=self, role=OWNER),
+        }
+
+    def is_owner(self, user_id) -> bool:
+        return user_id in self.owners
+
+    def is_admin(self, user_id) -> bool:
+        return user_id in self.owners or user_id in self.admins
+
+    def admin_ids(self) -> list:
+        ids = list(self.admins)
+        return ids + [uid for uid in self.owners if uid not in ids]
+
+    def grant(self, user_id):
+        self.admins.add(user_id)
+        if self.save is not None:
+            self.save(list(self.admins))
+
+    def revoke(self, user_id) -> bool:
+        if self.is_owner(user_id) or user_id not in self.admins:
+            return False
+        self.admins.discard(user_id)
+        if self.save is not None:
+            self.save(list(self.admins))
+        return True
+
+    def command(self, commands, role: str = ADMIN):
+        # filters.command + الصلاحية في filter واحد، فالهاندلر مش بيتنادى أصلاً لغير المصرح لهم
+        commands = [commands] if isinstance(commands, str) else list(commands)
+        self.guarded[role].update(commands)
+        return filters.command(commands) & self.filters[role]
+
+    def install(self, app):
+        # رد رفض واحد لكل الأوامر المحمية بدل ما كل هاندلر يكرر نفس الشرط
+        for role, commands in self.guarded.items():
+            if not commands:
+                continue
+
+            async def deny(client, message, text=DENIED_TEXT[role]):
+                await message.reply_text(text)
+
+            app.on_message(filters.command(sorted(commands)) & ~self.filters[role])(deny)
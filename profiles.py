@@ -0,0 +1,71 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+
+class ProfileCache:
+    # كاش لبيانات مستخدمين تيليجرام: TTL + LRU، والطلبات بتتجمع في get_users واحدة لكل batch
+    def __init__(self, app, ttl: float = 600, negative_ttl: float = 60, max_size: int = 5000,
+                 batch_size: int = 100, concurrency: int = 4):
+        self.app = app
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache = OrderedDict()
+
+    def _lookup(self, user_id, now: float):
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] <= now:
+            return False, None
+        self._cache.move_to_end(user_id)
+        return True, entry[1]
+
+    def _store(self, user_id, user):
+        ttl = self.ttl if user is not None else self.negative_ttl
+        self._cache[user_id] = (time.monotonic() + ttl, user)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, user_id):
+        return (await self.get_many([user_id])).get(int(user_id))
+
+    async def get_many(self, user_ids) -> dict:
+        now = time.monotonic()
+        found = {}
+        missing = []
+        for user_id in dict.fromkeys(int(uid) for uid in user_ids):
+            hit, user = self._lookup(user_id, now)
+            if hit:
+                found[user_id] = user
+            else:
+                missing.append(user_id)
+
+        if missing:
+            chunks = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            await asyncio.gather(*[self._fetch(chunk) for chunk in chunks])
+            for user_id in missing:
+                found[user_id] = self._cache.get(user_id, (0, None))[1]
+        return found
+
+    async def _fetch(self, chunk: list):
+        users = None
+        async with self._semaphore:
+            try:
+                users = await self.app.get_users(chunk)
+            except Exception:
+                pass
+
+        if users is None:
+            # لو ID واحد بايظ get_users بتفشل للـ batch كله، فنجرب كل واحد لوحده
+            if len(chunk) > 1:
+                await asyncio.gather(*[self._fetch([user_id]) for user_id in chunk])
+            else:
+                self._store(chunk[0], None)
+            return
+
+        by_id = {user.id: user for user in users}
+        for user_id in chunk:
+            self._store(user_id, by_id.get(user_id))
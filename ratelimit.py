@@ -0,0 +1,164 @@
+import time
+from collections import deque
+
+
+class SlidingWindowLimiter:
+    # كل مستخدم ليه limit طلب في آخر window ثانية
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.hits = {}
+        self.warned = set()
+        self._last_prune = time.monotonic()
+
+    def allow(self, key, now: float = None) -> bool:
+        now = now or time.monotonic()
+        hits = self.hits.get(key)
+        if hits is None:
+            hits = self.hits[key] = deque()
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+
+        if len(hits) >= self.limit:
+            return False
+
+        hits.append(now)
+        self.warned.discard(key)
+        if now - self._last_prune > self.window:
+            self.prune(now)
+        return True
+
+    def retry_after(self, key, now: float = None) -> float:
+        hits = self.hits.get(key)
+        if not hits:
+            return 0.0
+        now = now or time.monotonic()
+        return max(0.0, hits[0] + self.window - now)
+
+    def warn_once(self, key) -> bool:
+        # بنرد على أول طلب مرفوض بس علشان البوت نفسه مياخدش FloodWait
+        if key in self.warned:
+            return False
+        self.warned.add(key)
+        return True
+
+    def prune(self, now: float):
+        cutoff = now - self.window
+        for key in [key for key, hits in self.hits.items() if not hits or hits[-1] <= cutoff]:
+            del self.hits[key]
+            self.warned.discard(key)
+        self._last_prune = now
+
+
+class SharedRateLimiter:
+    # نفس الواجهة بس الطلبات متسجلة في state.db، فالـ limit واحد للمستخدم على كل الـ workers
+    # allow بتعمل كل حاجة في transaction واحدة (لازم تتنادى برا الـ loop)، وretry_after/warn_once
+    # بيرجعوا اللي allow حسبته لنفس المستخدم من غير ما يرجعوا للداتابيز
+    def __init__(self, storage, limit: int, window: float):
+        self.storage = storage
+        self.limit = limit
+        self.window = window
+        self._retry = {}
+        self._warn = {}
+        self._last_prune = 0.0
+
+    def allow(self, key, now: float = None) -> bool:
+        # time.time() مش monotonic علشان الوقت لازم يبقى واحد بين البروسسات
+        now = now or time.time()
+        key = str(key)
+
+        def check(conn):
+            conn.execute("DELETE FROM rate_hits WHERE key = ? AND ts <= ?", (key, now - self.window))
+            count, oldest = conn.execute("SELECT COUNT(*), MIN(ts) FROM rate_hits WHERE key = ?", (key,)).fetchone()
+            if count >= self.limit:
+                self._retry[key] = max(0.0, oldest + self.window - now)
+                self._warn[key] = conn.execute("INSERT OR IGNORE INTO rate_warned (key) VALUES (?)", (key,)).rowcount > 0
+                return False
+            conn.execute("INSERT INTO rate_hits (key, ts) VALUES (?, ?)", (key, now))
+            conn.execute("DELETE FROM rate_warned WHERE key = ?", (key,))
+            if now - self._last_prune > self.window:
+                self._last_prune = now
+                conn.execute("DELETE FROM rate_hits WHERE ts <= ?", (now - self.window,))
+                conn.execute("DELETE FROM rate_warned WHERE key NOT IN (SELECT key FROM rate_hits)")
+            return True
+
+        return self.storage.atomic(check)
+
+    def retry_after(self, key, now: float = None) -> float:
+        return self._retry.get(str(key), 0.0)
+
+    def warn_once(self, key) -> bool:
+        return self._warn.pop(str(key), False)
+
+
+class AttemptLog:
+    # المحاولات المرفوضة متقسمة على ساعات: bucket -> {(telegram_id, student_id): count}
+    def __init__(self, bucket_seconds: int = 3600, retention_buckets: int = 24 * 7):
+        self.bucket_seconds = bucket_seconds
+        self.retention_buckets = retention_buckets
+        self.buckets = {}
+
+    def record(self, user_id, student_id, now: float = None):
+        bucket_id = int((now or time.time()) // self.bucket_seconds)
+        bucket = self.buckets.get(bucket_id)
+        if bucket is None:
+            bucket = self.buckets[bucket_id] = {}
+            oldest = bucket_id - self.retention_buckets
+            for stale in [b for b in self.buckets if b <= oldest]:
+                del self.buckets[stale]
+        key = (str(user_id), str(student_id))
+        bucket[key] = bucket.get(key, 0) + 1
+
+    def per_user(self) -> dict:
+        totals = {}
+        for bucket in self.buckets.values():
+            for (uid, _), count in bucket.items():
+                totals[uid] = totals.get(uid, 0) + count
+        return totals
+
+    def by_user(self, user_id) -> dict:
+        user_id = str(user_id)
+        attempts = {}
+        for bucket in self.buckets.values():
+            for (uid, sid), count in bucket.items():
+                if uid == user_id:
+                    attempts[sid] = attempts.get(sid, 0) + count
+        return attempts
+
+
+class SharedAttemptLog(AttemptLog):
+    # وضع الـ workers: المحاولات المرفوضة بتتجمع في state.db من كل الـ workers؛ record بتحطها في pending
+    # و SharedUsageEventLog بيكتبها مع كل flush، والاستعلامات بتقرا من الداتابيز + اللي لسه ماتكتبش
+    def __init__(self, storage, bucket_seconds: int = 3600, retention_buckets: int = 24 * 7):
+        super().__init__(bucket_seconds, retention_buckets)
+        self.storage = storage
+        self.pending = {}
+
+    def record(self, user_id, student_id, now: float = None):
+        key = (int((now or time.time()) // self.bucket_seconds), str(user_id), str(student_id))
+        self.pending[key] = self.pending.get(key, 0) + 1
+
+    def _unflushed(self):
+        oldest = self.oldest_bucket()
+        return [(uid, sid, n) for (bucket, uid, sid), n in list(self.pending.items()) if bucket > oldest]
+
+    def oldest_bucket(self, now: float = None) -> int:
+        return int((now or time.time()) // self.bucket_seconds) - self.retention_buckets
+
+    def per_user(self) -> dict:
+        rows = self.storage.read(
+            "SELECT telegram_id, SUM(count) FROM attempts WHERE bucket > ? GROUP BY telegram_id", (self.oldest_bucket(),))
+        totals = dict(rows)
+        for uid, _, n in self._unflushed():
+            totals[uid] = totals.get(uid, 0) + n
+        return totals
+
+    def by_user(self, user_id) -> dict:
+        rows = self.storage.read(
+            "SELECT student_id, SUM(count) FROM attempts WHERE telegram_id = ? AND bucket > ? GROUP BY student_id",
+            (str(user_id), self.oldest_bucket()))
+        attempts = dict(rows)
+        for uid, sid, n in self._unflushed():
+            if uid == str(user_id):
+                attempts[sid] = attempts.get(sid, 0) + n
+        return attempts
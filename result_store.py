@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import time
+import pickle
+import hashlib
+import threading
+from datetime import datetime
+from typing import Optional
+from metrics import Histogram
+
+EXCEL_PARSE_SECONDS = Histogram("bot_excel_parse_seconds", "Time spent parsing a result workbook", (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
+def normalize_student_id(value) -> str:
+    student_id = str(value).strip()
+    if student_id.endswith('.0'):
+        student_id = student_id[:-2]
+    return student_id
+
+
+def file_signature(path: str):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def file_hash(path: str, extra: str = '') -> str:
+    digest = hashlib.sha256(extra.encode('utf-8'))
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultSnapshot:
+    # نسخة ثابتة من الشيت، الريلود بيبني واحدة جديدة ويبدلها مرة واحدة
+    def __init__(self, records: dict, signature, parse_time: float, digest: str, source: str):
+        self.records = records
+        self.signature = signature
+        self.parse_time = parse_time
+        self.digest = digest
+        self.source = source
+        self.loaded_at = datetime.now()
+        self.names = {sid: row['Name'] for sid, row in records.items() if isinstance(row.get('Name'), str)}
+        # الرد المتجهز لكل طالب؛ بيتمسح لوحده مع الريلود لأنه جزء من النسخة (digest)
+        self.rendered = {}
+        self._name_index = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def name_index(self):
+        # بيتبني مرة واحدة لكل نسخة من الشيت
+        if self._name_index is None:
+            with self._index_lock:
+                if self._name_index is None:
+                    from search import NameIndex
+                    self._name_index = NameIndex(self.names)
+        return self._name_index
+
+    def render(self, student_id, renderer) -> Optional[str]:
+        student_id = normalize_student_id(student_id)
+        text = self.rendered.get(student_id)
+        if text is None:
+            row = self.records.get(student_id)
+            if row is None:
+                return None
+            text = renderer(student_id, row)
+            self.rendered[student_id] = text
+        return text
+
+
+class ResultStore:
+    # الشيت بيتقري مرة واحدة وكل صف بيتخزن في dict بالـ ID
+    SNAPSHOT_VERSION = 2
+    DEFAULT_SCHEMA = {"header_row": 0, "id_column": "ID", "name_column": "Name"}
+
+    def __init__(self, path: str, sheet_name: str, cache_dir: str = '.cache', schema: dict = None, cache_name: str = None):
+        self.path = path
+        self.sheet_name = sheet_name
+        self.cache_dir = cache_dir
+        self.schema = dict(self.DEFAULT_SCHEMA, **(schema or {}))
+        self.cache_name = cache_name or f"{os.path.basename(path)}.{sheet_name}"
+        self.snapshot: Optional[ResultSnapshot] = None
+        self.last_used = time.monotonic()
+        self._load_lock = threading.RLock()
+        self._pending_signature = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.snapshot is not None
+
+    @property
+    def cache_file(self) -> str:
+        return os.path.join(self.cache_dir, f"{self.cache_name}.pkl")
+
+    def read_records(self) -> dict:
+        import pandas as pd
+
+        if self.schema.get("layout") == "scan":
+            return self.scan_records(pd.read_excel(self.path, sheet_name=self.sheet_name, header=None))
+
+        df = pd.read_excel(self.path, sheet_name=self.sheet_name, header=self.schema["header_row"])
+        df.columns = df.columns.astype(str).str.strip()
+        df.rename(columns={self.schema["id_column"]: 'id', self.schema["name_column"]: 'Name', 'اسم الطالب': 'Name'}, inplace=True)
+        df = df[df['id'].notna()]
+        df['id'] = df['id'].map(normalize_student_id)
+
+        records = {}
+        for row in df.to_dict('records'):
+            records.setdefault(row['id'], row)
+        return records
+
+    def scan_records(self, df) -> dict:
+        # شيتات متلخبطة (زي الكشوف المتحولة من PDF): العمود بيتغير من صفحة لصفحة،
+        # فبندور في كل صف على أول خلية شبه الكود، والاسم هو أقرب نص عربي قبلها
+        id_pattern = re.compile(self.schema.get("id_pattern", r"^\d{6,}$"))
+        records = {}
+        for values in df.itertuples(index=False):
+            cells = [normalize_student_id(v) if v == v and v is not None else '' for v in values]
+            for position, cell in enumerate(cells):
+                if id_pattern.match(cell):
+                    names = [c for c in cells[:position] if re.search('[\u0600-\u06FF]', c)]
+                    if names:
+                        records.setdefault(cell, {'id': cell, 'Name': names[-1]})
+                    break
+        return records
+
+    def read_cache(self, digest: str) -> Optional[dict]:
+        try:
+            with open(self.cache_file, 'rb') as f:
+                payload = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading snapshot {self.cache_file}: {e}")
+            return None
+
+        if payload.get("version") != self.SNAPSHOT_VERSION or payload.get("digest") != digest:
+            return None
+        return payload["records"]
+
+    def write_cache(self, digest: str, records: dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        payload = {"version": self.SNAPSHOT_VERSION, "digest": digest, "records": records}
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.cache_file)
+
+    def load(self, force: bool = False) -> ResultSnapshot:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Excel file '{self.path}' not found")
+
+        with self._load_lock:
+            signature = file_signature(self.path)
+            started = time.perf_counter()
+            digest = file_hash(self.path, json.dumps([self.sheet_name, self.schema], sort_keys=True))
+            records = None if force else self.read_cache(digest)
+            source = 'snapshot'
+            if records is None:
+                with EXCEL_PARSE_SECONDS.time():
+                    records = self.read_records()
+                source = 'excel'
+                try:
+                    self.write_cache(digest, records)
+                except Exception as e:
+                    print(f"Error writing snapshot {self.cache_file}: {e}")
+            snapshot = ResultSnapshot(records, signature, time.perf_counter() - started, digest, source)
+            self.snapshot = snapshot
+        return snapshot
+
+    def current(self) -> ResultSnapshot:
+        self.last_used = time.monotonic()
+        snapshot = self.snapshot
+        if snapshot is None:
+            with self._load_lock:
+                # لو التحميل المبدئي لسه شغال في thread تاني نستناه بدل ما نقرا الشيت مرتين
+                snapshot = self.snapshot or self.load()
+        return snapshot
+
+    def peek(self) -> Optional[ResultSnapshot]:
+        # الـ snapshot لو محمل من غير ما نحمل حاجة (آمنة على الـ loop)
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self.last_used = time.monotonic()
+        return snapshot
+
+    def unload(self):
+        self.snapshot = None
+
+    def changed(self) -> bool:
+        snapshot = self.snapshot
+        if snapshot is None or not os.path.exists(self.path):
+            return False
+        return file_signature(self.path) != snapshot.signature
+
+    def check_reload(self):
+        try:
+            if not self.changed():
+                self._pending_signature = None
+                return
+            # استنى لحد ما الملف يثبت (الرفع ممكن يكون لسه شغال)
+            signature = file_signature(self.path)
+            if signature != self._pending_signature:
+                self._pending_signature = signature
+                return
+            snapshot = self.load()
+            self._pending_signature = None
+            print(f"🔄 Reloaded {self.path}: {len(snapshot.records)} rows in {snapshot.parse_time:.2f}s")
+        except Exception as e:
+            print(f"Error reloading {self.path}: {e}")
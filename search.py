@@ -0,0 +1,98 @@
+import re
+import bisect
+
+TASHKEEL = re.compile('[ؐ-ًؚ-ٰٟـ]')
+LETTER_MAP = str.maketrans({
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    'ى': 'ي',
+    'ة': 'ه',
+})
+
+
+def normalize_arabic(text: str) -> str:
+    text = TASHKEEL.sub('', str(text))
+    return text.translate(LETTER_MAP).lower()
+
+
+def tokenize(text: str) -> list:
+    return normalize_arabic(text).split()
+
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    # فهرس مقلوب: كلمة -> الطلاب اللي في اسمهم الكلمة دي، وكمان trigrams للبحث التقريبي
+    EXACT_SCORE = 3
+    PREFIX_SCORE = 2
+    FUZZY_THRESHOLD = 0.5
+
+    def __init__(self, names: dict):
+        self.names = names
+        self.postings = {}
+        for sid, name in names.items():
+            for token in set(tokenize(name)):
+                self.postings.setdefault(token, set()).add(sid)
+        self.tokens = sorted(self.postings)
+        self.grams = {}
+        for token in self.tokens:
+            for gram in trigrams(token):
+                self.grams.setdefault(gram, set()).add(token)
+
+    def prefix_tokens(self, term: str):
+        start = bisect.bisect_left(self.tokens, term)
+        for token in self.tokens[start:]:
+            if not token.startswith(term):
+                break
+            yield token
+
+    def fuzzy_tokens(self, term: str):
+        term_grams = trigrams(term)
+        overlap = {}
+        for gram in term_grams:
+            for token in self.grams.get(gram, ()):
+                overlap[token] = overlap.get(token, 0) + 1
+        for token, shared in overlap.items():
+            similarity = shared / len(term_grams | trigrams(token))
+            if similarity >= self.FUZZY_THRESHOLD:
+                yield token, similarity
+
+    def _term_scores(self, term: str, fuzzy: bool) -> dict:
+        scores = {}
+        if fuzzy:
+            matches = self.fuzzy_tokens(term)
+        else:
+            matches = ((token, self.EXACT_SCORE if token == term else self.PREFIX_SCORE) for token in self.prefix_tokens(term))
+        for token, score in matches:
+            for sid in self.postings[token]:
+                if score > scores.get(sid, 0):
+                    scores[sid] = score
+        return scores
+
+    def _search(self, terms: list, fuzzy: bool) -> dict:
+        # كل كلمة في البحث لازم تطابق كلمة في الاسم
+        total = None
+        for term in terms:
+            scores = self._term_scores(term, fuzzy)
+            if total is None:
+                total = scores
+            else:
+                total = {sid: total[sid] + score for sid, score in scores.items() if sid in total}
+            if not total:
+                return {}
+        return total or {}
+
+    def search(self, query: str, limit: int = None) -> list:
+        terms = tokenize(query)
+        if not terms:
+            return []
+        scores = self._search(terms, fuzzy=False)
+        if not scores:
+            scores = self._search(terms, fuzzy=True)
+        ranked = sorted(scores, key=lambda sid: (-scores[sid], normalize_arabic(self.names[sid])))
+        return ranked[:limit] if limit else ranked
@@ -0,0 +1,61 @@
+import os
+import time
+import metrics
+
+STARTUP_READY_SECONDS = metrics.Gauge("bot_startup_ready_seconds", "Process start until the client is connected and serving")
+FIRST_UPDATE_SECONDS = metrics.Gauge("bot_startup_first_update_seconds", "Process start until the first update was handled")
+
+
+def process_started() -> float:
+    # وقت ما البروسس نفسها بدأت (قبل ما بايثون يحمل أي موديول)، ولو مش Linux بناخد وقت استيراد الموديول ده
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class StartupTimer:
+    # كل مرحلة بتتسجل بالوقت من أول البروسس، وأول update بيطبع التقرير ويقارنه بالـ budget
+    def __init__(self, budget: float, started: float = None):
+        self.budget = budget
+        self.started = started if started is not None else process_started()
+        self.phases = {}
+        self.first_update = None
+
+    def mark(self, phase: str) -> float:
+        elapsed = time.time() - self.started
+        self.phases[phase] = elapsed
+        if phase == "ready":
+            STARTUP_READY_SECONDS.set(elapsed)
+        return elapsed
+
+    def update_received(self):
+        if self.first_update is not None:
+            return
+        self.first_update = time.time() - self.started
+        FIRST_UPDATE_SECONDS.set(self.first_update)
+        print(self.report())
+        if self.over_budget:
+            print(f"⚠️ Startup took {self.first_update:.2f}s, over the {self.budget:.0f}s budget")
+
+    @property
+    def over_budget(self) -> bool:
+        return self.first_update is not None and self.first_update > self.budget
+
+    def report(self) -> str:
+        parts = [f"{phase} {elapsed:.2f}s" for phase, elapsed in sorted(self.phases.items(), key=lambda item: item[1])]
+        if self.first_update is not None:
+            parts.append(f"first update {self.first_update:.2f}s")
+        return "⏱️ Startup: " + " → ".join(parts)
+
+    def health(self):
+        # التقرير بيظهر في /healthz بس مابيخليهوش degraded؛ البطء مش سبب إن Render يعيد التشغيل
+        details = {phase: round(elapsed, 3) for phase, elapsed in self.phases.items()}
+        details["first_update"] = round(self.first_update, 3) if self.first_update is not None else None
+        details["budget"] = self.budget
+        details["over_budget"] = self.over_budget
+        return True, details
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from events import SUCCESS
+
+
+class UsageStats:
+    # إحصائيات بتتحدث مع كل طلب بدل ما /stats يلف على كل الداتا
+    def __init__(self, student_usage: dict, links, attempts=None, top_k: int = 5):
+        self.top_k = top_k
+        self.rebuild(student_usage, links, attempts)
+
+    def rebuild(self, student_usage: dict, links, attempts=None):
+        self.total_lookups = 0
+        self.top = {}
+        self.abuse = {}
+        for sid, info in student_usage.items():
+            count = info.get("count", 0)
+            self.total_lookups += count
+            self._update_top(sid, count)
+            for uid, tries in info.get("by", {}).items():
+                # المحاولات على كود مش مربوط بالمستخدم ده
+                if links.student_of(uid) != str(sid):
+                    self.abuse[str(uid)] = self.abuse.get(str(uid), 0) + tries
+        # المحاولات المرفوضة اللي اتسجلت في سجل الأحداث
+        if attempts is not None:
+            for uid, tries in attempts.per_user().items():
+                self.abuse[uid] = self.abuse.get(uid, 0) + tries
+
+    def _update_top(self, student_id, count):
+        # العدادات بتزيد بس، فأي حد برا الـ top عمره ما هيعدي أقل واحد جواه من غير ما يتحدث هنا
+        if student_id in self.top or len(self.top) < self.top_k:
+            self.top[student_id] = count
+            return
+        weakest = min(self.top, key=self.top.get)
+        if count > self.top[weakest]:
+            del self.top[weakest]
+            self.top[student_id] = count
+
+    def record_lookup(self, student_id, count: int):
+        self.total_lookups += 1
+        self._update_top(student_id, count)
+
+    def record_denied(self, user_id, student_id):
+        user_id = str(user_id)
+        self.abuse[user_id] = self.abuse.get(user_id, 0) + 1
+
+    def top_students(self) -> list:
+        return sorted(self.top.items(), key=lambda item: item[1], reverse=True)
+
+    def offenders(self, min_tries: int = 1) -> list:
+        offenders = [(uid, tries) for uid, tries in self.abuse.items() if tries >= min_tries]
+        return sorted(offenders, key=lambda item: item[1], reverse=True)
+
+    def snapshot(self):
+        # (إجمالي الطلبات, الأكتر طلباً, المحاولات المرفوضة لكل مستخدم) لـ /stats
+        return self.total_lookups, self.top_students(), self.offenders()
+
+    def breakdown(self, series: dict, days: int = 7):
+        # من عدادات الساعات بتاعة سجل الأحداث ({ساعة: {outcome: عدد}}) فبتفضل موجودة بعد الريستارت:
+        # الطلبات الناجحة لكل يوم في آخر days يوم، ولكل ساعة في اليوم في نفس الفترة
+        today = datetime.now().date()
+        per_day = {today - timedelta(days=offset): 0 for offset in range(days - 1, -1, -1)}
+        per_hour = dict.fromkeys(range(24), 0)
+        for hour, counts in series.items():
+            lookups = counts.get(SUCCESS, 0)
+            moment = datetime.fromtimestamp(hour * 3600)
+            if not lookups or moment.date() not in per_day:
+                continue
+            per_day[moment.date()] += lookups
+            per_hour[moment.hour] += lookups
+        if not any(per_day.values()):
+            return None, None
+        return per_day, per_hour
+
+
+class SharedUsageStats(UsageStats):
+    # وضع الـ workers: كل worker بيشوف جزء من الطلبات بس، فالأرقام بتتقرا من state.db وقت /stats
+    # (برا الـ loop) بدل ما تتحدث في الميموري مع كل طلب
+    def __init__(self, storage, attempts, top_k: int = 5):
+        self.storage = storage
+        self.attempts = attempts
+        self.top_k = top_k
+
+    def rebuild(self, student_usage: dict = None, links=None, attempts=None):
+        pass
+
+    def record_lookup(self, student_id, count: int):
+        pass
+
+    def record_denied(self, user_id, student_id):
+        pass
+
+    @property
+    def total_lookups(self) -> int:
+        return self.storage.read("SELECT COALESCE(SUM(count), 0) FROM usage")[0][0]
+
+    def top_students(self) -> list:
+        return self.storage.read("SELECT student_id, count FROM usage ORDER BY count DESC LIMIT ?", (self.top_k,))
+
+    def offenders(self, min_tries: int = 1) -> list:
+        offenders = [(uid, tries) for uid, tries in self.attempts.per_user().items() if tries >= min_tries]
+        return sorted(offenders, key=lambda item: item[1], reverse=True)
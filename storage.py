@@ -0,0 +1,439 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from metrics import Histogram
+
+USAGE_FLUSH_SECONDS = Histogram("bot_usage_flush_seconds", "Time spent writing one batch of usage increments to SQLite")
+
+
+def load_json(filename, default):
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return default
+
+
+def save_json(filename, data):
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_file, filename)
+
+
+class JsonStorage:
+    # الطريقة القديمة: كل تعديل بيكتب الملف كله (عن طريق الكاتب في الخلفية)
+    # عدادات الاستعلام مابقتش هنا: بتتحفظ في سجل الأحداث (events.py) وstudent_usage.json بيتقرا مرة واحدة للترحيل
+    shared = False
+    persists_usage = False
+
+    def __init__(self, writer, links_file, admins_file, usage_file):
+        self.writer = writer
+        self.links_file = links_file
+        self.admins_file = admins_file
+        self.usage_file = usage_file
+        self.links = {}
+        self.admins = []
+        self.usage = {}
+
+    def load_links(self) -> dict:
+        self.links = load_json(self.links_file, {})
+        return self.links
+
+    def load_admins(self, default) -> list:
+        self.admins = load_json(self.admins_file, default)
+        return self.admins
+
+    def load_usage(self) -> dict:
+        self.usage = load_json(self.usage_file, {})
+        return self.usage
+
+    def _save_links(self):
+        self.writer.submit(self.links_file, dict(self.links))
+
+    def _save_usage(self):
+        self.writer.submit(self.usage_file, {sid: dict(usage) for sid, usage in self.usage.items()})
+
+    def save_link(self, user_id, student_id):
+        self._save_links()
+
+    def save_links(self, pairs):
+        if pairs:
+            self._save_links()
+
+    def delete_link(self, user_id):
+        self._save_links()
+
+    def clear_links(self):
+        self._save_links()
+
+    def save_admins(self, admin_list):
+        self.admins = list(admin_list)
+        self.writer.submit(self.admins_file, self.admins)
+
+    def add_usage_batch(self, batch: dict):
+        pass
+
+    def clear_usage(self):
+        self._save_usage()
+
+    def close(self):
+        pass
+
+
+class SqliteStorage:
+    # SQLite بـ WAL: كل تعديل upsert لصف واحد جوه transaction
+    shared = False
+    persists_usage = True
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS links (
+            telegram_id TEXT PRIMARY KEY,
+            student_id TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY,
+            telegram_id INTEGER NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS usage (
+            student_id TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_time TEXT
+        );
+    """
+
+    def __init__(self, writer, db_file):
+        self.writer = writer
+        self.db_file = db_file
+        self.created = not os.path.exists(db_file)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.atomic(self._migrate_admins)
+        # القراية على connection تانية بقفل لوحدها: في WAL الـ SELECT مابيستناش قفل الكتابة، فقراية من الـ loop
+        # مش بتقف ورا transaction مستنية worker تاني يخلص (لحد الـ busy timeout)
+        self._read_lock = threading.Lock()
+        self.read_conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None, timeout=10)
+
+    @staticmethod
+    def _migrate_admins(conn):
+        # النسخة القديمة كان telegram_id هو الـ rowid نفسه، فـ ORDER BY rowid كان بيرتب بالـ ID مش بترتيب الإضافة.
+        # الترتيب القديم ضاع أصلاً، فبننقل الصفوف زي ما هي وأي إضافة بعد كده بتيجي في الآخر
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(admins)")]
+        if "id" in columns:
+            return
+        conn.execute("ALTER TABLE admins RENAME TO admins_old")
+        conn.execute("CREATE TABLE admins (id INTEGER PRIMARY KEY, telegram_id INTEGER NOT NULL UNIQUE)")
+        conn.execute("INSERT INTO admins (telegram_id) SELECT telegram_id FROM admins_old ORDER BY rowid")
+        conn.execute("DROP TABLE admins_old")
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def read(self, sql, params=()):
+        with self._read_lock:
+            return self.read_conn.execute(sql, params).fetchall()
+
+    def transaction(self, statements):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self.conn.execute(sql, params)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def atomic(self, func):
+        # func(conn) بتتنفذ جوه BEGIN IMMEDIATE، فمفيش بروسس تاني يقدر يكتب في النص
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self.conn)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def _write(self, sql, params=()):
+        self.writer.run(self.transaction, [(sql, params)])
+
+    def load_links(self) -> dict:
+        return {uid: sid for uid, sid in self.read("SELECT telegram_id, student_id FROM links")}
+
+    def load_admins(self, default) -> list:
+        rows = self.read("SELECT telegram_id FROM admins ORDER BY id")
+        if not rows:
+            self.save_admins(default)
+            return list(default)
+        return [row[0] for row in rows]
+
+    def load_usage(self) -> dict:
+        usage = {}
+        for sid, count, last_time in self.read("SELECT student_id, count, last_time FROM usage"):
+            usage[sid] = {"count": count, "last_time": last_time}
+        return usage
+
+    def save_link(self, user_id, student_id):
+        self._write(
+            "INSERT INTO links (telegram_id, student_id) VALUES (?, ?) "
+            "ON CONFLICT(telegram_id) DO UPDATE SET student_id = excluded.student_id",
+            (str(user_id), str(student_id)),
+        )
+
+    def save_links(self, pairs):
+        # دفعة كاملة في transaction واحدة
+        statements = [
+            ("INSERT INTO links (telegram_id, student_id) VALUES (?, ?) "
+             "ON CONFLICT(telegram_id) DO UPDATE SET student_id = excluded.student_id", (str(uid), str(sid)))
+            for uid, sid in pairs
+        ]
+        if statements:
+            self.writer.run(self.transaction, statements)
+
+    def delete_link(self, user_id):
+        self._write("DELETE FROM links WHERE telegram_id = ?", (str(user_id),))
+
+    def clear_links(self):
+        self._write("DELETE FROM links")
+
+    def save_admins(self, admin_list):
+        statements = [("DELETE FROM admins", ())]
+        statements += [("INSERT OR IGNORE INTO admins (telegram_id) VALUES (?)", (int(uid),)) for uid in admin_list]
+        self.writer.run(self.transaction, statements)
+
+    # بنزود العداد اللي في الداتابيز بدل ما نكتب فوقه، علشان لو في أكتر من بروسس بيعد
+    USAGE_INCREMENT = (
+        "INSERT INTO usage (student_id, count, last_time) VALUES (?, ?, ?) "
+        "ON CONFLICT(student_id) DO UPDATE SET count = usage.count + excluded.count, "
+        "last_time = max(coalesce(usage.last_time, ''), excluded.last_time)"
+    )
+
+    def add_usage_batch(self, batch: dict):
+        statements = [(self.USAGE_INCREMENT, (str(sid), added, last_time)) for sid, (added, last_time) in batch.items()]
+        self.writer.run(self._add_usage, statements)
+
+    @USAGE_FLUSH_SECONDS.timed
+    def _add_usage(self, statements):
+        self.transaction(statements)
+
+    def usage_of(self, student_id) -> dict:
+        rows = self.read("SELECT count, last_time FROM usage WHERE student_id = ?", (str(student_id),))
+        return {"count": rows[0][0], "last_time": rows[0][1]} if rows else {}
+
+    def clear_usage(self):
+        self._write("DELETE FROM usage")
+
+    def import_json(self, links_file, admins_file, usage_file):
+        links = load_json(links_file, {})
+        admins = load_json(admins_file, [])
+        usage = load_json(usage_file, {})
+
+        statements = []
+        for uid, sid in links.items():
+            # لو الكود مربوط بأكتر من حساب بنسيب أول واحد بس
+            statements.append(("INSERT OR IGNORE INTO links (telegram_id, student_id) VALUES (?, ?)", (str(uid), str(sid))))
+        for uid in admins:
+            statements.append(("INSERT OR IGNORE INTO admins (telegram_id) VALUES (?)", (int(uid),)))
+        for sid, info in usage.items():
+            statements.append((
+                "INSERT OR REPLACE INTO usage (student_id, count, last_time) VALUES (?, ?, ?)",
+                (str(sid), info.get("count", 0), info.get("last_time")),
+            ))
+        self.transaction(statements)
+        return len(links), len(admins), len(usage)
+
+    def close(self):
+        with self._read_lock:
+            self.read_conn.close()
+        with self._lock:
+            self.conn.close()
+
+
+class SharedStorage(SqliteStorage):
+    # وضع الـ workers: كذا بروسس على نفس state.db. الربط والإدمنات بيتكتبوا على طول
+    # من SharedLinkIndex و SharedAdminList، فالحفظ هنا مالوش لازمة
+    shared = True
+    SCHEMA = SqliteStorage.SCHEMA + """
+        CREATE TABLE IF NOT EXISTS claimed_updates (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            claimed_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        );
+        CREATE TABLE IF NOT EXISTS rate_hits (
+            key TEXT NOT NULL,
+            ts REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS rate_hits_key ON rate_hits (key, ts);
+        CREATE TABLE IF NOT EXISTS rate_warned (
+            key TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS event_hours (
+            hour INTEGER NOT NULL,
+            outcome TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, outcome)
+        );
+        CREATE TABLE IF NOT EXISTS attempts (
+            bucket INTEGER NOT NULL,
+            telegram_id TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (bucket, telegram_id, student_id)
+        );
+    """
+    CLAIM_RETENTION = 24 * 3600
+
+    def __init__(self, writer, db_file):
+        super().__init__(writer, db_file)
+        self._last_claim_prune = 0.0
+
+    def claim_update(self, chat_id, message_id) -> bool:
+        # تيليجرام بيبعت نفس الـ update لكل السيشنز، فأول worker يسجل الرسالة هو اللي يرد عليها
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO claimed_updates (chat_id, message_id, claimed_at) VALUES (?, ?, ?)",
+                (int(chat_id), int(message_id), now),
+            )
+            if now - self._last_claim_prune > 600:
+                self._last_claim_prune = now
+                self.conn.execute("DELETE FROM claimed_updates WHERE claimed_at < ?", (now - self.CLAIM_RETENTION,))
+            return cursor.rowcount > 0
+
+    def save_link(self, user_id, student_id):
+        pass
+
+    def save_links(self, pairs):
+        pass
+
+    def delete_link(self, user_id):
+        pass
+
+    def clear_links(self):
+        pass
+
+    def save_admins(self, admin_list):
+        pass
+
+
+class SharedAdminList:
+    # قائمة الإدمنات من state.db، مع كاش قصير علشان كل رسالة بتسأل عليها
+    def __init__(self, storage: SqliteStorage, default, ttl: float = 2.0):
+        self.storage = storage
+        self.ttl = ttl
+        self._ids = []
+        self._set = set()
+        self._expires = 0.0
+        if not self._read():
+            for uid in default:
+                self.add(uid)
+
+    def _read(self) -> list:
+        ids = [row[0] for row in self.storage.read("SELECT telegram_id FROM admins ORDER BY id")]
+        self._ids, self._set = ids, set(ids)
+        self._expires = time.monotonic() + self.ttl
+        return ids
+
+    def _current(self) -> list:
+        if time.monotonic() >= self._expires:
+            self._read()
+        return self._ids
+
+    def __contains__(self, user_id) -> bool:
+        self._current()
+        return user_id in self._set
+
+    def __iter__(self):
+        return iter(list(self._current()))
+
+    def __len__(self):
+        return len(self._current())
+
+    def add(self, user_id):
+        self.storage.execute("INSERT OR IGNORE INTO admins (telegram_id) VALUES (?)", (int(user_id),))
+        self._expires = 0.0
+
+    def discard(self, user_id):
+        self.storage.execute("DELETE FROM admins WHERE telegram_id = ?", (int(user_id),))
+        self._expires = 0.0
+
+
+class UsageBuffer:
+    # العدادات بتتحدث في الميموري على طول، والحفظ بيتجمع ويتكتب كل flush_interval
+    # ثانية أو كل flush_every طلب؛ أقصى حاجة ممكن تضيع لو البروسس وقع هي flush_every عدة
+    # اللي بيتكتب هو الزيادة من آخر flush، فكذا بروسس يقدروا يعدوا على نفس الداتابيز
+    def __init__(self, storage, usage: dict, flush_interval: float = 10.0, flush_every: int = 200):
+        self.storage = storage
+        self.usage = usage
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.dirty = {}
+        self.pending_events = 0
+        self._task = None
+
+    def record(self, student_id):
+        self.dirty[student_id] = self.dirty.get(student_id, 0) + 1
+        self.pending_events += 1
+        if self.pending_events >= self.flush_every:
+            self.flush()
+
+    def discard(self):
+        self.dirty.clear()
+        self.pending_events = 0
+
+    def flush(self):
+        if not self.dirty:
+            return
+        batch = {sid: (added, self.usage[sid].get("last_time")) for sid, added in self.dirty.items() if sid in self.usage}
+        self.discard()
+        if batch:
+            self.storage.add_usage_batch(batch)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+
+def open_storage(backend, writer, db_file, links_file, admins_file, usage_file):
+    if backend in ('sqlite', 'shared'):
+        storage = (SharedStorage if backend == 'shared' else SqliteStorage)(writer, db_file)
+        if storage.created:
+            imported = storage.import_json(links_file, admins_file, usage_file)
+            print(f"📦 Imported {imported[0]} links, {imported[1]} admins, {imported[2]} usage rows into {db_file}")
+        return storage
+    return JsonStorage(writer, links_file, admins_file, usage_file)
+
+
+if __name__ == "__main__":
+    # استيراد مرة واحدة: python storage.py [state.db]
+    import sys
+
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'state.db'
+
+    class _InlineWriter:
+        def run(self, func, *args):
+            func(*args)
+
+    storage = SqliteStorage(_InlineWriter(), db_file)
+    imported = storage.import_json('user_student_map.json', 'admin_list.json', 'student_usage.json')
+    storage.close()
+    print(f"✅ Imported {imported[0]} links, {imported[1]} admins, {imported[2]} usage rows into {db_file}")
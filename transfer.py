@@ -0,0 +1,126 @@
+import os
+import csv
+import itertools
+from result_store import normalize_student_id
+
+# تصدير واستيراد بالجملة: الملفات بتتكتب وتتقرا صف صف على دفعات من غير DataFrame
+EXPORT_CHUNK = 5000
+IMPORT_BATCH = 500
+EXPORT_KINDS = ("links", "usage", "results")
+EXPORT_FORMATS = ("csv", "xlsx")
+
+
+def chunked(rows, size: int):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_export(path: str, fmt: str, header: list, rows) -> int:
+    written = 0
+    if fmt == "xlsx":
+        from openpyxl import Workbook
+
+        # write_only بيكتب الصفوف على الديسك أول بأول بدل ما يشيل الشيت كله في الميموري
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(header)
+        for chunk in chunked(rows, EXPORT_CHUNK):
+            for row in chunk:
+                sheet.append(row)
+            written += len(chunk)
+        workbook.save(path)
+        return written
+
+    # utf-8-sig علشان Excel يفتح الأسامي العربي صح
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for chunk in chunked(rows, EXPORT_CHUNK):
+            writer.writerows(chunk)
+            written += len(chunk)
+    return written
+
+
+def result_rows(snapshot):
+    # أعمدة أول صف هي اللي بتتصدر، والصفوف بتتولد واحد واحد من الـ snapshot
+    first = next(iter(snapshot.records.values()), None)
+    columns = [column for column in (first or {}) if column != 'id']
+    header = ["ID"] + columns
+    rows = ([sid] + [row.get(column) for column in columns] for sid, row in snapshot.records.items())
+    return header, rows
+
+
+def read_table(path: str):
+    if path.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield ["" if value is None else str(value) for value in row]
+        finally:
+            workbook.close()
+        return
+
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        yield from csv.reader(f)
+
+
+class LinkImport:
+    # بيقرا ملف فيه عمودين telegram_id و student_id ويطلع دفعات سليمة بس، والغلط بيتعد
+    def __init__(self, path: str, batch_size: int = IMPORT_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.bad_lines = []
+
+    def _reject(self, line: int):
+        self.invalid += 1
+        if len(self.bad_lines) < 10:
+            self.bad_lines.append(line)
+
+    def batches(self):
+        table = read_table(self.path)
+        header = [cell.strip().lower() for cell in next(table, [])]
+        if "telegram_id" not in header or "student_id" not in header:
+            raise ValueError("الملف لازم يكون فيه عمودين telegram_id و student_id")
+        uid_col, sid_col = header.index("telegram_id"), header.index("student_id")
+
+        seen_users, seen_students = set(), set()
+        batch = []
+        for line, row in enumerate(table, start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            self.rows += 1
+            if len(row) <= max(uid_col, sid_col):
+                self._reject(line)
+                continue
+            uid = normalize_student_id(row[uid_col].strip())
+            sid = normalize_student_id(row[sid_col].strip())
+            if not uid.isdigit() or not sid.isdigit():
+                self._reject(line)
+                continue
+            if uid in seen_users or sid in seen_students:
+                self.duplicates += 1
+                continue
+            seen_users.add(uid)
+            seen_students.add(sid)
+            batch.append((uid, sid))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,24 @@
+import os
+import sys
+import signal
+import subprocess
+
+
+def run_workers(count: int, script: str, prepare=None):
+    # كل worker بروسس لوحده بسيشن تيليجرام خاص بيه، والربط والعدادات والإدمنات في state.db
+    if prepare is not None:
+        prepare()
+    processes = []
+    for worker_id in range(count):
+        env = dict(os.environ, WORKER_ID=str(worker_id), STATE_BACKEND="shared")
+        processes.append(subprocess.Popen([sys.executable, script], env=env))
+    print(f"🧵 Started {count} workers: {', '.join(str(p.pid) for p in processes)}")
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    return max(process.wait() for process in processes)